@@ -2,24 +2,164 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog, messagebox, scrolledtext, Text # filedialog still needed for _browse_root_dir
 import os
+import collections
+import queue
+import threading
+import time
+
+from file_processor_engine import (
+    COMPILED_SOURCES_FILENAME, EXPORTED_PATHS_FILENAME, SELECTIVE_EXPORT_FILENAME, FILE_INDEX_FILENAME,
+    BUNDLE_COMPRESSION_SUFFIXES, LOG_ERROR, LOG_SUMMARY, LOG_DETAIL, Job, JobCancelled, ContentClassifier, DigestCache,
+    parse_exclusions, parse_size_rules, parse_selection_list, load_selection_file, format_job_progress, format_extension_report,
+    scan_extensions, compile_sources, export_paths, export_selected_files,
+)
+
+# --- Status Logging ---
+LOG_VERBOSITY_LABELS = {"Errors only": LOG_ERROR, "Summaries": LOG_SUMMARY, "Per-file": LOG_DETAIL}
+
+class StatusLog:
+    """Buffers status messages and flushes them into a ScrolledText in batches.
+
+    write() is thread-safe, so job threads log straight into it; the widget is
+    only touched from a master.after() timer on the Tk thread. The pending
+    buffer and the widget both keep just the last `max_lines` lines. When a log
+    file is open, every message is also streamed there regardless of verbosity.
+    `flush_ns` totals the time spent updating the widget, for run profiles.
+    """
+    def __init__(self, master, widget, max_lines=5000, flush_interval_ms=100):
+        self.master = master
+        self.widget = widget
+        self.max_lines = max_lines
+        self.flush_interval_ms = flush_interval_ms
+        self.verbosity = LOG_DETAIL
+        self.pending = collections.deque(maxlen=max_lines)
+        self.lock = threading.Lock()
+        self.log_file = None
+        self.flush_ns = 0
+        self.master.after(self.flush_interval_ms, self._flush_loop)
+
+    def write(self, message, level=LOG_SUMMARY):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.write(message + "\n")
+            if level <= self.verbosity:
+                self.pending.append(message)
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+        self.widget.configure(state='normal')
+        self.widget.delete('1.0', tk.END)
+        self.widget.configure(state='disabled')
+
+    def open_log_file(self, path):
+        self.close_log_file()
+        log_file = open(path, 'w', encoding='utf-8', errors='backslashreplace')
+        with self.lock:
+            self.log_file = log_file
+
+    def close_log_file(self):
+        with self.lock:
+            log_file, self.log_file = self.log_file, None
+        if log_file is not None:
+            log_file.close()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            batch = "\n".join(self.pending) + "\n"
+            self.pending.clear()
+        started_ns = time.perf_counter_ns()
+        self.widget.configure(state='normal')
+        self.widget.insert(tk.END, batch)
+        # The widget always ends with an implicit newline, so 'end-1c' sits on the last real line + 1
+        excess_lines = int(self.widget.index('end-1c').split('.')[0]) - 1 - self.max_lines
+        if excess_lines > 0:
+            self.widget.delete('1.0', f"{excess_lines + 1}.0")
+        self.widget.see(tk.END)
+        self.widget.configure(state='disabled')
+        self.flush_ns += time.perf_counter_ns() - started_ns
+
+    def _flush_loop(self):
+        self.flush()
+        self.master.after(self.flush_interval_ms, self._flush_loop)
+
+# --- Background Jobs ---
+class BackgroundJob(Job):
+    """Runs an engine operation on a daemon thread and reports back through a queue.
+
+    The worker is called with the job as its only argument. It must not touch
+    any Tk objects. Log lines go straight into the thread-safe StatusLog; the
+    Tk side drains the completion message from `messages` in a master.after()
+    poll.
+    """
+    def __init__(self, name, worker, status_log):
+        super().__init__(status_log.write)
+        self.name = name
+        self.worker = worker
+        self.status_log = status_log
+        self.messages = queue.Queue()
+        self.started_at = None
+        self.thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        # Status pane updates happen on the Tk thread, so the profile samples them instead of timing them
+        flush_ns_at_start = self.status_log.flush_ns
+        self.profile.phase_probes["tk_display"] = lambda: self.status_log.flush_ns - flush_ns_at_start
+        self.thread = threading.Thread(target=self._run, name=f"job-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            result = self.worker(self)
+        except JobCancelled:
+            outcome = ('cancelled', None)
+        except Exception as e:
+            outcome = ('error', e)
+        else:
+            outcome = ('done', result)
+        self.finish()
+        self.messages.put(outcome)
 
-# --- Helper Function ---
-def normalize_path(path_str):
-    """Normalizes path separators for consistent comparison."""
-    return path_str.replace('\\', '/').strip('/')
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
 
 class MainApp:
     # Predefined output filenames
-    COMPILED_SOURCES_FILENAME = "compiled_sources.txt"
-    EXPORTED_PATHS_FILENAME = "exported_paths.txt"
-    SELECTIVE_EXPORT_FILENAME = "selectively_exported_files.txt"
+    COMPILED_SOURCES_FILENAME = COMPILED_SOURCES_FILENAME
+    EXPORTED_PATHS_FILENAME = EXPORTED_PATHS_FILENAME
+    SELECTIVE_EXPORT_FILENAME = SELECTIVE_EXPORT_FILENAME
+    FILE_INDEX_FILENAME = FILE_INDEX_FILENAME
+
+    # Threads used to read file contents ahead of the writer (1 = sequential).
+    # More threads pay off on network mounts and cold caches, not on warm local disks.
+    DEFAULT_READ_WORKERS = 1
+    MAX_READ_WORKERS = 64
+
+    # How often running jobs are polled for progress and completion
+    JOB_POLL_INTERVAL_MS = 100
+
+    # Status panes keep only the most recent lines and are refreshed on a timer
+    STATUS_LOG_MAX_LINES = 5000
+    STATUS_LOG_FLUSH_INTERVAL_MS = 100
+    STATUS_LOG_FILENAME_TEMPLATE = "{tab_key}_status.log"
 
     def __init__(self, master):
         self.master = master
         master.title("Tabbed File Processor (Auto-Save)")
-        master.geometry("750x650") 
+        master.geometry("750x650")
 
         self.root_dir_var = tk.StringVar()
+        self.jobs = {} # tab key -> BackgroundJob, until its completion has been handled (at most one per tab)
+        self.status_logs = []
+        self.log_verbosity_var = tk.StringVar(value="Per-file")
+        self.save_full_log_var = tk.BooleanVar(value=False)
+        self.use_file_index_var = tk.BooleanVar(value=False)
+        self.read_workers_var = tk.IntVar(value=self.DEFAULT_READ_WORKERS)
+        self.output_compression_var = tk.StringVar(value="none")
+        self.output_shard_size_var = tk.StringVar(value="0")
 
         # --- Top Section: Root Directory ---
         root_settings_frame = tk.LabelFrame(master, text="Shared Settings", padx=10, pady=10)
@@ -29,6 +169,23 @@ class MainApp:
         self.root_dir_entry = tk.Entry(root_settings_frame, textvariable=self.root_dir_var, width=60)
         self.root_dir_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         tk.Button(root_settings_frame, text="Browse...", command=self._browse_root_dir).grid(row=0, column=2, padx=5, pady=5)
+
+        log_options_frame = tk.Frame(root_settings_frame)
+        log_options_frame.grid(row=1, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
+        tk.Label(log_options_frame, text="Status Log Detail:").pack(side=tk.LEFT)
+        ttk.Combobox(log_options_frame, textvariable=self.log_verbosity_var, values=list(LOG_VERBOSITY_LABELS), state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(log_options_frame, text="Save full log to <tab>_status.log", variable=self.save_full_log_var).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(log_options_frame, text=f"Use file index ({self.FILE_INDEX_FILENAME}) for Get All Extensions / Export Paths / selection patterns", variable=self.use_file_index_var).pack(side=tk.LEFT, padx=5)
+        tk.Label(log_options_frame, text="Read Threads:").pack(side=tk.LEFT, padx=(10, 0))
+        tk.Spinbox(log_options_frame, from_=1, to=self.MAX_READ_WORKERS, textvariable=self.read_workers_var, width=4).pack(side=tk.LEFT, padx=5)
+        output_options_frame = tk.Frame(root_settings_frame)
+        output_options_frame.grid(row=2, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
+        tk.Label(output_options_frame, text="Output Compression:").pack(side=tk.LEFT)
+        ttk.Combobox(output_options_frame, textvariable=self.output_compression_var, values=list(BUNDLE_COMPRESSION_SUFFIXES), state="readonly", width=6).pack(side=tk.LEFT, padx=5)
+        tk.Label(output_options_frame, text="Shard Size (MB, 0 = one file):").pack(side=tk.LEFT, padx=(10, 0))
+        tk.Entry(output_options_frame, textvariable=self.output_shard_size_var, width=6).pack(side=tk.LEFT, padx=5)
+        tk.Label(output_options_frame, text="(compiler and selective exporter)").pack(side=tk.LEFT)
+        self.log_verbosity_var.trace_add("write", self._on_log_verbosity_change)
         root_settings_frame.grid_columnconfigure(1, weight=1)
 
         # --- Notebook for Tabbed Interface ---
@@ -46,49 +203,164 @@ class MainApp:
         self._create_compiler_ui(self.compiler_tab)
         self._create_path_exporter_ui(self.path_exporter_tab)
         self._create_selective_exporter_ui(self.selective_exporter_tab)
-        
+
         self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_change)
 
 
-    def _log_status(self, message, target_status_widget, clear_first=False):
-        target_status_widget.configure(state='normal')
+    def _log_status(self, message, target_status_log, clear_first=False, level=LOG_SUMMARY):
         if clear_first:
-            target_status_widget.delete('1.0', tk.END)
-        target_status_widget.insert(tk.END, message + "\n")
-        target_status_widget.see(tk.END)
-        target_status_widget.configure(state='disabled')
-        self.master.update_idletasks()
+            target_status_log.clear()
+        target_status_log.write(message, level)
+
+    def _create_status_log(self, status_widget):
+        status_log = StatusLog(self.master, status_widget, self.STATUS_LOG_MAX_LINES, self.STATUS_LOG_FLUSH_INTERVAL_MS)
+        status_log.verbosity = LOG_VERBOSITY_LABELS[self.log_verbosity_var.get()]
+        self.status_logs.append(status_log)
+        return status_log
+
+    def _on_log_verbosity_change(self, *args):
+        verbosity = LOG_VERBOSITY_LABELS[self.log_verbosity_var.get()]
+        for status_log in self.status_logs:
+            status_log.verbosity = verbosity
 
     def _parse_exclusions(self, var_str, is_extensions=False):
-        raw_list = var_str.get().split(',')
-        if is_extensions:
-            return {f".{ext.strip().lstrip('.').lower()}" for ext in raw_list if ext.strip()}
-        else:
-            return {normalize_path(d.strip()) for d in raw_list if d.strip()}
+        return parse_exclusions(var_str.get(), is_extensions)
 
     def _browse_root_dir(self):
         directory = filedialog.askdirectory(parent=self.master)
         if directory:
             self.root_dir_var.set(directory)
-            print(f"Root directory set to: {directory}") 
+            print(f"Root directory set to: {directory}")
+
+    def _browse_selection_file(self):
+        list_filepath = filedialog.askopenfilename(parent=self.master, title="Select a list of files to export")
+        if list_filepath:
+            self.selective_exporter_list_file_var.set(list_filepath)
 
     def _check_root_dir_set(self, show_error=True):
         if not self.root_dir_var.get() or not os.path.isdir(self.root_dir_var.get()):
             if show_error:
-                messagebox.showerror("Root Directory Not Set", 
-                                     "Please select a valid root directory first.", 
+                messagebox.showerror("Root Directory Not Set",
+                                     "Please select a valid root directory first.",
                                      parent=self.master)
             return False
         return True
-    
+
+    def _get_index_path(self):
+        """Returns the file index path if the index is enabled, else None."""
+        if not self.use_file_index_var.get():
+            return None
+        return os.path.join(os.getcwd(), self.FILE_INDEX_FILENAME)
+
+    def _get_content_classifier(self):
+        """Builds the compiler's ContentClassifier, or returns None (after showing an error) if a size setting is invalid."""
+        try:
+            max_size_bytes = int(self.compiler_max_size_var.get().strip() or "0") * 1024
+            if max_size_bytes < 0:
+                raise ValueError("Max Content Size must not be negative")
+            size_rules = parse_size_rules(self.compiler_size_rules_var.get())
+        except ValueError as e:
+            messagebox.showerror("Invalid Setting", f"Invalid content size setting: {e}", parent=self.master)
+            return None
+        cache_path = os.path.join(os.getcwd(), self.FILE_INDEX_FILENAME)
+        return ContentClassifier(self.compiler_detect_binary_var.get(), max_size_bytes, size_rules, cache_path)
+
+    def _get_output_format(self):
+        """Returns (compression, shard_bytes) for content outputs, or None (after showing an error) if the shard size is invalid."""
+        try:
+            shard_mb = int(self.output_shard_size_var.get().strip() or "0")
+        except ValueError:
+            shard_mb = -1
+        if shard_mb < 0:
+            messagebox.showerror("Invalid Setting", "Shard Size must be a whole number of MB (0 = one file).", parent=self.master)
+            return None
+        return self.output_compression_var.get(), shard_mb * 1024 * 1024
+
+    def _get_read_workers(self):
+        """Returns the configured read thread count, or None (after showing an error) if it is invalid."""
+        try:
+            read_workers = self.read_workers_var.get()
+        except tk.TclError:
+            read_workers = 0
+        if not 1 <= read_workers <= self.MAX_READ_WORKERS:
+            messagebox.showerror("Invalid Setting", f"Read Threads must be a number from 1 to {self.MAX_READ_WORKERS}.", parent=self.master)
+            return None
+        return read_workers
+
     def _on_tab_change(self, event):
         if not self._check_root_dir_set(show_error=False):
             pass
 
+    # --- Job Handling ---
+    def _create_job_controls(self, parent_tab_frame, tab_key):
+        """Adds the progress readout and Cancel button shared by every tab."""
+        progress_var = tk.StringVar(value="Idle")
+        job_frame = tk.Frame(parent_tab_frame)
+        job_frame.pack(padx=0, pady=(0, 5), fill="x", side=tk.TOP)
+        tk.Button(job_frame, text="Cancel", command=lambda: self._cancel_job(tab_key)).pack(side=tk.RIGHT)
+        tk.Label(job_frame, textvariable=progress_var, anchor="w").pack(side=tk.LEFT, fill="x", expand=True)
+        return progress_var
+
+    def _start_job(self, tab_key, worker, status_log, progress_var, start_message, on_done, on_error):
+        """Starts `worker` on a background thread unless this tab already has a job.
+
+        A tab stays busy until _poll_job has handled its job's completion, not
+        just until the thread exits, so a new job never receives the old one's
+        results or has its log file closed by the old poll.
+        """
+        if tab_key in self.jobs:
+            messagebox.showwarning("Job Running", "This tab already has a running job. Cancel it or wait for it to finish.", parent=self.master)
+            return None
+        if self.save_full_log_var.get():
+            log_filepath = os.path.join(os.getcwd(), self.STATUS_LOG_FILENAME_TEMPLATE.format(tab_key=tab_key))
+            try:
+                status_log.open_log_file(log_filepath)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not open log file: {e}\nFile: {log_filepath}", parent=self.master)
+                return None
+        self._log_status(start_message, status_log, clear_first=True)
+        job = BackgroundJob(tab_key, worker, status_log)
+        self.jobs[tab_key] = job
+        job.start()
+        self.master.after(self.JOB_POLL_INTERVAL_MS, self._poll_job, job, progress_var, on_done, on_error)
+        return job
+
+    def _poll_job(self, job, progress_var, on_done, on_error):
+        try:
+            kind, payload = job.messages.get_nowait()
+        except queue.Empty:
+            progress_var.set(f"{'Cancelling' if job.cancel_event.is_set() else 'Running'}: {format_job_progress(job)}")
+            self.master.after(self.JOB_POLL_INTERVAL_MS, self._poll_job, job, progress_var, on_done, on_error)
+            return
+        try:
+            if kind == 'done':
+                progress_var.set(f"Done: {format_job_progress(job)}")
+                on_done(payload)
+            elif kind == 'cancelled':
+                progress_var.set(f"Cancelled: {format_job_progress(job)}")
+                self._log_status("Job cancelled.", job.status_log)
+            elif kind == 'error':
+                progress_var.set(f"Failed: {format_job_progress(job)}")
+                on_error(payload)
+        finally:
+            job.status_log.close_log_file()
+            del self.jobs[job.name] # the tab is free again
+
+    def _cancel_job(self, tab_key):
+        job = self.jobs.get(tab_key)
+        if job is not None and job.is_running():
+            job.cancel()
+
     # --- UI Creation for Compiler Tab ---
     def _create_compiler_ui(self, parent_tab_frame):
         self.compiler_excluded_extensions_var = tk.StringVar()
         self.compiler_excluded_dirs_var = tk.StringVar()
+        self.compiler_incremental_var = tk.BooleanVar(value=False)
+        self.compiler_dedup_var = tk.BooleanVar(value=False)
+        self.compiler_ignore_files_var = tk.BooleanVar(value=False)
+        self.compiler_detect_binary_var = tk.BooleanVar(value=True)
+        self.compiler_max_size_var = tk.StringVar(value="0")
+        self.compiler_size_rules_var = tk.StringVar()
 
         controls_frame = tk.LabelFrame(parent_tab_frame, text="Compiler Settings", padx=10, pady=10)
         controls_frame.pack(padx=0, pady=0, fill="x")
@@ -99,38 +371,63 @@ class MainApp:
 
         tk.Label(controls_frame, text="Exclude Dirs (relative, comma-sep):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
         tk.Entry(controls_frame, textvariable=self.compiler_excluded_dirs_var, width=40).grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        tk.Label(controls_frame, text="Max Content Size (KB, 0 = none):").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        tk.Entry(controls_frame, textvariable=self.compiler_max_size_var, width=40).grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+
+        tk.Label(controls_frame, text="Size Rules (ext=KB, comma-sep):").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        tk.Entry(controls_frame, textvariable=self.compiler_size_rules_var, width=40).grid(row=3, column=1, padx=5, pady=5, sticky="ew")
+
+        tk.Checkbutton(controls_frame, text="Write binary files path-only", variable=self.compiler_detect_binary_var).grid(row=4, column=0, padx=5, pady=5, sticky="w")
+        tk.Checkbutton(controls_frame, text="Incremental (re-read only files changed since the last compile)", variable=self.compiler_incremental_var).grid(row=4, column=1, columnspan=2, padx=5, pady=5, sticky="w")
+        tk.Checkbutton(controls_frame, text="Honour .gitignore / .ignore", variable=self.compiler_ignore_files_var).grid(row=5, column=0, padx=5, pady=5, sticky="w")
+        tk.Checkbutton(controls_frame, text="Deduplicate (write identical files once, then as references)", variable=self.compiler_dedup_var).grid(row=5, column=1, columnspan=2, padx=5, pady=5, sticky="w")
         controls_frame.grid_columnconfigure(1, weight=1)
 
         tk.Button(parent_tab_frame, text=f"Compile Sources to {self.COMPILED_SOURCES_FILENAME}", command=self._compiler_compile_sources, bg="lightblue").pack(padx=0, pady=5, fill="x")
+        self.compiler_progress_var = self._create_job_controls(parent_tab_frame, 'compiler')
 
         status_frame = tk.LabelFrame(parent_tab_frame, text="Compiler Status / Found Extensions", padx=10, pady=10)
         status_frame.pack(padx=0, pady=5, fill="both", expand=True)
         self.compiler_status_text = scrolledtext.ScrolledText(status_frame, height=10, wrap=tk.WORD)
         self.compiler_status_text.pack(fill="both", expand=True)
         self.compiler_status_text.configure(state='disabled')
+        self.compiler_log = self._create_status_log(self.compiler_status_text)
 
     # --- UI Creation for Path Exporter Tab ---
     def _create_path_exporter_ui(self, parent_tab_frame):
         self.path_exporter_excluded_dirs_var = tk.StringVar()
+        self.path_exporter_ignore_files_var = tk.BooleanVar(value=False)
 
         controls_frame = tk.LabelFrame(parent_tab_frame, text="Path Exporter Settings", padx=10, pady=10)
         controls_frame.pack(padx=0, pady=0, fill="x")
 
         tk.Label(controls_frame, text="Exclude Dirs (relative, comma-sep):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         tk.Entry(controls_frame, textvariable=self.path_exporter_excluded_dirs_var, width=40).grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        tk.Checkbutton(controls_frame, text="Honour .gitignore / .ignore", variable=self.path_exporter_ignore_files_var).grid(row=1, column=0, padx=5, pady=5, sticky="w")
         controls_frame.grid_columnconfigure(1, weight=1)
 
         tk.Button(parent_tab_frame, text=f"Export Paths to {self.EXPORTED_PATHS_FILENAME}", command=self._path_exporter_export_paths, bg="lightgreen").pack(padx=0, pady=5, fill="x")
+        self.path_exporter_progress_var = self._create_job_controls(parent_tab_frame, 'path_exporter')
 
         status_frame = tk.LabelFrame(parent_tab_frame, text="Path Exporter Status", padx=10, pady=10)
         status_frame.pack(padx=0, pady=5, fill="both", expand=True)
         self.path_exporter_status_text = scrolledtext.ScrolledText(status_frame, height=8, wrap=tk.WORD)
         self.path_exporter_status_text.pack(fill="both", expand=True)
         self.path_exporter_status_text.configure(state='disabled')
+        self.path_exporter_log = self._create_status_log(self.path_exporter_status_text)
 
     # --- UI Creation for Selective Exporter Tab ---
     def _create_selective_exporter_ui(self, parent_tab_frame):
-        input_area_frame = tk.LabelFrame(parent_tab_frame, text="Files to Export (Relative Paths, One Per Line)", padx=10, pady=10)
+        self.selective_exporter_list_file_var = tk.StringVar()
+
+        list_file_frame = tk.Frame(parent_tab_frame)
+        list_file_frame.pack(padx=0, pady=(0, 5), fill="x", side=tk.TOP)
+        tk.Label(list_file_frame, text="List File (optional, added to the box below):").pack(side=tk.LEFT)
+        tk.Entry(list_file_frame, textvariable=self.selective_exporter_list_file_var, width=40).pack(side=tk.LEFT, padx=5, fill="x", expand=True)
+        tk.Button(list_file_frame, text="Browse...", command=self._browse_selection_file).pack(side=tk.LEFT)
+        tk.Button(list_file_frame, text="Clear", command=lambda: self.selective_exporter_list_file_var.set("")).pack(side=tk.LEFT, padx=(5, 0))
+
+        input_area_frame = tk.LabelFrame(parent_tab_frame, text="Files to Export (Relative Paths, or glob:/re: Patterns, One Per Line)", padx=10, pady=10)
         input_area_frame.pack(padx=0, pady=0, fill="both", expand=True)
 
         self.selective_exporter_file_list_text = Text(input_area_frame, height=15, width=70, wrap=tk.WORD)
@@ -140,12 +437,14 @@ class MainApp:
         self.selective_exporter_file_list_text.pack(pady=(0,5), fill="both", expand=True, side=tk.LEFT)
 
         tk.Button(parent_tab_frame, text=f"Export Selected to {self.SELECTIVE_EXPORT_FILENAME}", command=self._selective_exporter_export_files, bg="lightyellow").pack(padx=0, pady=5, fill="x", side=tk.TOP)
+        self.selective_exporter_progress_var = self._create_job_controls(parent_tab_frame, 'selective_exporter')
 
         status_frame = tk.LabelFrame(parent_tab_frame, text="Selective Exporter Status", padx=10, pady=10)
         status_frame.pack(padx=0, pady=5, fill="both", expand=True, side=tk.TOP)
         self.selective_exporter_status_text = scrolledtext.ScrolledText(status_frame, height=8, wrap=tk.WORD)
         self.selective_exporter_status_text.pack(fill="both", expand=True)
         self.selective_exporter_status_text.configure(state='disabled')
+        self.selective_exporter_log = self._create_status_log(self.selective_exporter_status_text)
 
 
     # --- Logic for Compiler ---
@@ -153,53 +452,18 @@ class MainApp:
         if not self._check_root_dir_set(): return
         root_dir = self.root_dir_var.get()
         excluded_dirs_set = self._parse_exclusions(self.compiler_excluded_dirs_var)
-        
-        self._log_status("Scanning for extensions...", self.compiler_status_text, clear_first=True)
-        found_extensions_data = {} 
-        files_scanned = 0
-        
-        try:
-            for dirpath, dirnames, filenames in os.walk(root_dir, topdown=True):
-                current_rel_dir_path = normalize_path(os.path.relpath(dirpath, root_dir))
-                if current_rel_dir_path == '.': current_rel_dir_path = ""
-
-                original_dirnames = list(dirnames) 
-                dirnames[:] = [] 
-                for d_name in original_dirnames:
-                    subdir_rel_path = normalize_path(os.path.join(current_rel_dir_path, d_name))
-                    is_excluded = any(subdir_rel_path == ex_dir or subdir_rel_path.startswith(ex_dir + '/') for ex_dir in excluded_dirs_set if ex_dir)
-                    if not is_excluded:
-                        dirnames.append(d_name)
-
-                is_current_dir_excluded = any(current_rel_dir_path == ex_dir or (current_rel_dir_path.startswith(ex_dir + '/') and ex_dir) for ex_dir in excluded_dirs_set if ex_dir)
-                if is_current_dir_excluded:
-                    self._log_status(f"Skipping excluded directory: {current_rel_dir_path or '(root level excluded dir)'}", self.compiler_status_text)
-                    continue
-
-                for filename in filenames:
-                    files_scanned += 1
-                    relative_path_normalized = normalize_path(os.path.join(current_rel_dir_path, filename))
-                    _, ext = os.path.splitext(filename)
-                    ext = ext.lower()
-                    if ext:
-                        if ext not in found_extensions_data:
-                            found_extensions_data[ext] = []
-                        if len(found_extensions_data[ext]) < 3:
-                            found_extensions_data[ext].append(relative_path_normalized)
-            
-            if found_extensions_data:
-                log_message = "Found extensions (up to 3 examples each, from non-excluded directories):\n"
-                for ext_key in sorted(found_extensions_data.keys()):
-                    log_message += f"\n{ext_key}:\n"
-                    for example_path in found_extensions_data[ext_key]:
-                        log_message += f"  - {example_path}\n"
-                self._log_status(log_message, self.compiler_status_text)
-            else:
-                self._log_status("No files with extensions found in non-excluded directories.", self.compiler_status_text)
-            self._log_status(f"Total files scanned (in non-excluded dirs): {files_scanned}", self.compiler_status_text)
-        except Exception as e:
+        index_path = self._get_index_path()
+        ignore_files = self.compiler_ignore_files_var.get()
+
+        def on_done(result):
+            self._log_status(format_extension_report(*result), self.compiler_log)
+
+        def on_error(e):
             messagebox.showerror("Error", f"Error scanning extensions: {e}", parent=self.master)
-            self._log_status(f"Error scanning extensions: {e}", self.compiler_status_text)
+            self._log_status(f"Error scanning extensions: {e}", self.compiler_log, level=LOG_ERROR)
+
+        self._start_job('compiler', lambda job: scan_extensions(root_dir, excluded_dirs_set, job, index_path, ignore_files),
+                        self.compiler_log, self.compiler_progress_var, "Scanning for extensions...", on_done, on_error)
 
     def _compiler_compile_sources(self):
         if not self._check_root_dir_set(): return
@@ -207,71 +471,31 @@ class MainApp:
         output_filename = self.COMPILED_SOURCES_FILENAME
         output_filepath = os.path.join(os.getcwd(), output_filename)
 
-        self._log_status(f"Starting source compilation to {output_filepath}...", self.compiler_status_text, clear_first=True)
         root_dir = self.root_dir_var.get()
         excluded_extensions_set = self._parse_exclusions(self.compiler_excluded_extensions_var, is_extensions=True)
         excluded_dirs_set = self._parse_exclusions(self.compiler_excluded_dirs_var)
-
-        files_processed_count = 0
-        try:
-            with open(output_filepath, 'w', encoding='utf-8', errors='surrogateescape') as outfile:
-                for dirpath, dirnames, filenames in os.walk(root_dir, topdown=True):
-                    current_rel_dir_path = normalize_path(os.path.relpath(dirpath, root_dir))
-                    if current_rel_dir_path == '.': current_rel_dir_path = ""
-
-                    original_dirnames = list(dirnames)
-                    dirnames[:] = []
-                    for d_name in original_dirnames:
-                        subdir_rel_path = normalize_path(os.path.join(current_rel_dir_path, d_name))
-                        is_excluded = any(subdir_rel_path == ex_dir or subdir_rel_path.startswith(ex_dir + '/') for ex_dir in excluded_dirs_set if ex_dir)
-                        if not is_excluded:
-                            dirnames.append(d_name)
-                    
-                    is_current_dir_excluded = any(current_rel_dir_path == ex_dir or (current_rel_dir_path.startswith(ex_dir + '/') and ex_dir) for ex_dir in excluded_dirs_set if ex_dir)
-                    if is_current_dir_excluded:
-                        self._log_status(f"Skipping excluded dir: {current_rel_dir_path or '(root level excluded dir)'}", self.compiler_status_text)
-                        continue
-
-                    for filename in filenames:
-                        _, ext = os.path.splitext(filename)
-                        ext = ext.lower() # e.g., '.txt'
-                        
-                        full_path = os.path.join(dirpath, filename)
-                        relative_path_normalized = normalize_path(os.path.join(current_rel_dir_path, filename))
-
-                        # Common header for all processed files/paths
-                        outfile.write(f"======= {relative_path_normalized} =======\n")
-
-                        # Check if the extension is in the exclusion list
-                        if excluded_extensions_set and ext in excluded_extensions_set:
-                            self._log_status(f"Path-only (ext excluded): {relative_path_normalized}", self.compiler_status_text)
-                            # For excluded extensions, only the header is written, followed by newlines.
-                            outfile.write("\n") # Add a blank line after the header for path-only entries.
-                        else:
-                            # If not an excluded extension, process content
-                            self._log_status(f"Processing (content): {relative_path_normalized}", self.compiler_status_text)
-                            try:
-                                with open(full_path, 'r', encoding='utf-8', errors='surrogateescape') as infile_content:
-                                    file_content = infile_content.read()
-                                    outfile.write(file_content)
-                                # Ensure a newline before the "END OF" marker if content doesn't end with one
-                                if file_content and not file_content.endswith('\n'):
-                                    outfile.write("\n")
-                                outfile.write(f"======= END OF {relative_path_normalized} =======\n\n")
-                            except Exception as e_read:
-                                # Write error to output file, including the path for clarity
-                                error_message = f"ERROR READING FILE ({relative_path_normalized}): {e_read}\n"
-                                outfile.write(error_message)
-                                outfile.write(f"======= END OF {relative_path_normalized} (ERROR) =======\n\n")
-                                self._log_status(f"Error reading {relative_path_normalized}: {e_read}", self.compiler_status_text)
-                        
-                        files_processed_count += 1
-            
-            self._log_status(f"Compilation complete. {files_processed_count} file entries written to {output_filepath}", self.compiler_status_text)
+        incremental = self.compiler_incremental_var.get()
+        ignore_files = self.compiler_ignore_files_var.get()
+        read_workers = self._get_read_workers()
+        if read_workers is None: return
+        output_format = self._get_output_format()
+        if output_format is None: return
+        classifier = self._get_content_classifier()
+        if classifier is None: return
+        digests = DigestCache(os.path.join(os.getcwd(), self.FILE_INDEX_FILENAME)) if self.compiler_dedup_var.get() else None
+
+        def on_done(files_processed_count):
+            self._log_status(f"Compilation complete. {files_processed_count} file entries written to {output_filepath}", self.compiler_log)
             messagebox.showinfo("Success", f"Compilation complete. {files_processed_count} file entries written to:\n{output_filepath}", parent=self.master)
-        except Exception as e:
+
+        def on_error(e):
             messagebox.showerror("Error", f"Error during compilation: {e}\nFile: {output_filepath}", parent=self.master)
-            self._log_status(f"Error during compilation: {e}", self.compiler_status_text)
+            self._log_status(f"Error during compilation: {e}", self.compiler_log, level=LOG_ERROR)
+
+        self._start_job('compiler', lambda job: compile_sources(root_dir, output_filepath, excluded_extensions_set, excluded_dirs_set, job, incremental, read_workers, classifier=classifier,
+                                                                 compression=output_format[0], shard_bytes=output_format[1], digests=digests,
+                                                                 ignore_files=ignore_files),
+                        self.compiler_log, self.compiler_progress_var, f"Starting source compilation to {output_filepath}...", on_done, on_error)
 
 
     # --- Logic for Path Exporter ---
@@ -281,42 +505,21 @@ class MainApp:
         output_filename = self.EXPORTED_PATHS_FILENAME
         output_filepath = os.path.join(os.getcwd(), output_filename)
 
-        self._log_status(f"Starting path export to {output_filepath}...", self.path_exporter_status_text, clear_first=True)
         root_dir = self.root_dir_var.get()
         excluded_dirs_set = self._parse_exclusions(self.path_exporter_excluded_dirs_var)
+        index_path = self._get_index_path()
+        ignore_files = self.path_exporter_ignore_files_var.get()
 
-        paths_exported_count = 0
-        try:
-            with open(output_filepath, 'w', encoding='utf-8') as outfile:
-                for dirpath, dirnames, filenames in os.walk(root_dir, topdown=True):
-                    current_rel_dir_path = normalize_path(os.path.relpath(dirpath, root_dir))
-                    if current_rel_dir_path == '.': current_rel_dir_path = ""
-
-                    original_dirnames = list(dirnames)
-                    dirnames[:] = []
-                    for d_name in original_dirnames:
-                        subdir_rel_path = normalize_path(os.path.join(current_rel_dir_path, d_name))
-                        is_excluded = any(subdir_rel_path == ex_dir or subdir_rel_path.startswith(ex_dir + '/') for ex_dir in excluded_dirs_set if ex_dir)
-                        if not is_excluded:
-                            dirnames.append(d_name)
-
-                    is_current_dir_excluded = any(current_rel_dir_path == ex_dir or (current_rel_dir_path.startswith(ex_dir + '/') and ex_dir) for ex_dir in excluded_dirs_set if ex_dir)
-                    if is_current_dir_excluded:
-                        self._log_status(f"Skipping excluded dir: {current_rel_dir_path or '(root level excluded dir)'}", self.path_exporter_status_text)
-                        continue
-
-                    for filename in filenames:
-                        relative_path_normalized = normalize_path(os.path.join(current_rel_dir_path, filename))
-                        outfile.write(relative_path_normalized + "\n")
-                        paths_exported_count += 1
-                        if paths_exported_count % 200 == 0:
-                             self._log_status(f"Exported {paths_exported_count} paths...", self.path_exporter_status_text)
-            
-            self._log_status(f"Path export complete. {paths_exported_count} path(s) written to {output_filepath}", self.path_exporter_status_text)
+        def on_done(paths_exported_count):
+            self._log_status(f"Path export complete. {paths_exported_count} path(s) written to {output_filepath}", self.path_exporter_log)
             messagebox.showinfo("Success", f"Exported {paths_exported_count} paths to:\n{output_filepath}", parent=self.master)
-        except Exception as e:
+
+        def on_error(e):
             messagebox.showerror("Error", f"Error during path export: {e}\nFile: {output_filepath}", parent=self.master)
-            self._log_status(f"Error during path export: {e}", self.path_exporter_status_text)
+            self._log_status(f"Error during path export: {e}", self.path_exporter_log, level=LOG_ERROR)
+
+        self._start_job('path_exporter', lambda job: export_paths(root_dir, output_filepath, excluded_dirs_set, job, index_path, ignore_files),
+                        self.path_exporter_log, self.path_exporter_progress_var, f"Starting path export to {output_filepath}...", on_done, on_error)
 
     # --- Logic for Selective Exporter ---
     def _selective_exporter_export_files(self):
@@ -324,60 +527,54 @@ class MainApp:
 
         output_filename = self.SELECTIVE_EXPORT_FILENAME
         output_filepath = os.path.join(os.getcwd(), output_filename)
-        
-        self._log_status(f"Starting selective file export to {output_filepath}...", self.selective_exporter_status_text, clear_first=True)
+
         root_dir = self.root_dir_var.get()
-        
+        read_workers = self._get_read_workers()
+        if read_workers is None: return
+        output_format = self._get_output_format()
+        if output_format is None: return
+
         raw_file_list = self.selective_exporter_file_list_text.get("1.0", tk.END).strip()
-        if not raw_file_list:
-            messagebox.showwarning("No Files", "Please enter at least one relative file path.", parent=self.master)
-            self._log_status("No file paths provided.", self.selective_exporter_status_text)
+        list_filepath = self.selective_exporter_list_file_var.get().strip()
+        if not raw_file_list and not list_filepath:
+            messagebox.showwarning("No Files", "Please enter at least one relative file path or pattern, or choose a list file.", parent=self.master)
+            self._log_status("No file paths provided.", self.selective_exporter_log, clear_first=True)
             return
 
-        relative_paths_to_export = [normalize_path(p.strip()) for p in raw_file_list.splitlines() if p.strip()]
+        try:
+            selection = parse_selection_list(raw_file_list)
+        except ValueError as e:
+            messagebox.showerror("Invalid Pattern", str(e), parent=self.master)
+            return
 
-        if not relative_paths_to_export:
+        if not selection and not list_filepath:
             messagebox.showwarning("No Files", "No valid file paths found after processing input.", parent=self.master)
-            self._log_status("No valid file paths to process.", self.selective_exporter_status_text)
+            self._log_status("No valid file paths to process.", self.selective_exporter_log, clear_first=True)
             return
+        index_path = self._get_index_path()
 
-        files_processed_count = 0
-        errors_encountered = 0
-        try:
-            with open(output_filepath, 'w', encoding='utf-8', errors='surrogateescape') as outfile:
-                for rel_path in relative_paths_to_export:
-                    full_path = os.path.join(root_dir, rel_path) 
-                    normalized_rel_path_for_output = rel_path 
-
-                    if not os.path.isfile(full_path):
-                        self._log_status(f"SKIPPING (Not a file or not found): {normalized_rel_path_for_output}", self.selective_exporter_status_text)
-                        outfile.write(f"--- SKIPPED (Not a file or not found): {normalized_rel_path_for_output} ---\n\n")
-                        errors_encountered +=1
-                        continue
-
-                    self._log_status(f"Processing: {normalized_rel_path_for_output}", self.selective_exporter_status_text)
-                    outfile.write(f"--- RELATIVE PATH: {normalized_rel_path_for_output} ---\n")
-                    try:
-                        with open(full_path, 'r', encoding='utf-8', errors='surrogateescape') as infile_content:
-                            outfile.write(infile_content.read())
-                        outfile.write("\n\n")
-                        files_processed_count += 1
-                    except Exception as e_read:
-                        outfile.write(f"ERROR READING FILE ({normalized_rel_path_for_output}): {e_read}\n\n")
-                        self._log_status(f"Error reading {normalized_rel_path_for_output}: {e_read}", self.selective_exporter_status_text)
-                        errors_encountered +=1
-            
+        def export_job(job):
+            # The list file is read on the job thread; large lists never go through the Text widget
+            full_selection = selection + load_selection_file(list_filepath) if list_filepath else selection
+            return export_selected_files(root_dir, output_filepath, full_selection, job, read_workers,
+                                         compression=output_format[0], shard_bytes=output_format[1], index_path=index_path)
+
+        def on_done(result):
+            files_processed_count, errors_encountered = result
             summary_message = f"Selective export complete. {files_processed_count} file(s) successfully written."
             if errors_encountered > 0:
                 summary_message += f" {errors_encountered} file(s) had issues (see log)."
-            self._log_status(f"{summary_message} Output: {output_filepath}", self.selective_exporter_status_text)
+            self._log_status(f"{summary_message} Output: {output_filepath}", self.selective_exporter_log)
             messagebox.showinfo("Success", f"{summary_message}\nOutput saved to:\n{output_filepath}", parent=self.master)
 
-        except Exception as e:
+        def on_error(e):
             messagebox.showerror("Error", f"Error during selective export: {e}\nFile: {output_filepath}", parent=self.master)
-            self._log_status(f"Error during selective export: {e}", self.selective_exporter_status_text)
+            self._log_status(f"Error during selective export: {e}", self.selective_exporter_log, level=LOG_ERROR)
+
+        self._start_job('selective_exporter', export_job,
+                        self.selective_exporter_log, self.selective_exporter_progress_var, f"Starting selective file export to {output_filepath}...", on_done, on_error)
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = MainApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
@@ -0,0 +1,357 @@
+"""Benchmarks for the file processing engine on generated trees.
+
+Generate a synthetic tree once, run every tool on it headlessly (each run in
+its own child process, so peak RSS is per tool), then compare two result files:
+
+    python file_processor_bench.py generate /tmp/bench_tree --profile mixed
+    python file_processor_bench.py run /tmp/bench_tree -o before.json --repeat 3
+    python file_processor_bench.py run /tmp/bench_tree -o after.json --repeat 3
+    python file_processor_bench.py compare before.json after.json
+
+Profiles: quick, wide, deep, million (about 1M small files), large (a few
+multi-GB files) and mixed (binary and text files plus excluded dirs). Any
+profile setting can be overridden on the command line. The tree is fully
+determined by its settings and seed; its description is saved next to it,
+as /tmp/bench_tree.bench_tree.json, so the benchmarks never see it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_TREE_SUFFIX = ".bench_tree.json" # the description sits next to the tree, never inside it
+TOOLS = ("extensions", "compile", "export-paths", "export-selected")
+SELECTED_SAMPLE_MAX = 10000
+
+# width: subdirectories per directory, depth: directory levels below the root
+BENCH_PROFILES = {
+    "quick": dict(width=4, depth=3, files_per_dir=20, file_size=2048),
+    "wide": dict(width=5000, depth=1, files_per_dir=10, file_size=1024),
+    "deep": dict(width=1, depth=150, files_per_dir=20, file_size=1024),
+    "million": dict(width=10, depth=4, files_per_dir=90, file_size=256),
+    "large": dict(width=4, depth=2, files_per_dir=10, file_size=4096, large_files=3, large_file_mb=2048),
+    "mixed": dict(width=6, depth=3, files_per_dir=40, file_size=8192, binary_ratio=0.25, excluded_dirs=20),
+}
+BENCH_DEFAULTS = dict(width=4, depth=3, files_per_dir=20, file_size=2048, binary_ratio=0.0,
+                      excluded_dirs=0, large_files=0, large_file_mb=0, seed=1)
+
+TEXT_EXTENSIONS = (".py", ".js", ".txt", ".c", ".json")
+BINARY_EXTENSIONS = (".bin", ".dat", ".png")
+
+# --- Tree Generation ---
+def _text_block(rng, size):
+    """Returns `size` bytes of source-like text with LF line endings."""
+    words = [b"def", b"return", b"value", b"index", b"import", b"self", b"=", b"+", b"(x)", b"# note"]
+    lines = []
+    total = 0
+    while total < size:
+        line = b" ".join(rng.choice(words) for _ in range(rng.randint(3, 12))) + b"\n"
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)[:size]
+
+def _binary_block(rng, size):
+    return rng.randbytes(size)
+
+def _write_dir_files(dir_path, rel_dir, settings, rng, counters, selected):
+    for i in range(settings["files_per_dir"]):
+        if rng.random() < settings["binary_ratio"]:
+            name = f"f{i:04d}{BINARY_EXTENSIONS[i % len(BINARY_EXTENSIONS)]}"
+            data = _binary_block(rng, settings["file_size"])
+        else:
+            name = f"f{i:04d}{TEXT_EXTENSIONS[i % len(TEXT_EXTENSIONS)]}"
+            data = counters["text_block"][:settings["file_size"]]
+        with open(os.path.join(dir_path, name), 'wb') as f:
+            f.write(data)
+        counters["files"] += 1
+        counters["bytes"] += len(data)
+        if len(selected) < SELECTED_SAMPLE_MAX and counters["files"] % 7 == 0:
+            selected.append(f"{rel_dir}/{name}" if rel_dir else name)
+
+def generate_tree(root_dir, settings):
+    """Creates a synthetic tree under root_dir (which must not exist) and returns its description."""
+    rng = random.Random(settings["seed"])
+    counters = {"files": 0, "dirs": 0, "bytes": 0, "text_block": _text_block(rng, settings["file_size"])}
+    selected = []
+    os.makedirs(root_dir)
+    started_at = time.perf_counter()
+
+    # Breadth-first, so `selected` samples every level of the tree
+    level = [("", root_dir)]
+    for depth in range(settings["depth"] + 1):
+        next_level = []
+        for rel_dir, dir_path in level:
+            _write_dir_files(dir_path, rel_dir, settings, rng, counters, selected)
+            if depth == settings["depth"]:
+                continue
+            for w in range(settings["width"]):
+                child_rel = f"{rel_dir}/d{w}" if rel_dir else f"d{w}"
+                child_path = os.path.join(dir_path, f"d{w}")
+                os.mkdir(child_path)
+                counters["dirs"] += 1
+                next_level.append((child_rel, child_path))
+        level = next_level
+
+    # Excluded dirs hold one level of files each, so their cost is only the pruning check
+    excluded = []
+    for i in range(settings["excluded_dirs"]):
+        rel_dir = f"excluded{i:03d}"
+        os.makedirs(os.path.join(root_dir, rel_dir, "nested"))
+        _write_dir_files(os.path.join(root_dir, rel_dir, "nested"), f"{rel_dir}/nested", settings, rng, counters, [])
+        counters["dirs"] += 2
+        excluded.append(rel_dir)
+
+    large_files = []
+    if settings["large_files"]:
+        os.makedirs(os.path.join(root_dir, "large"))
+        counters["dirs"] += 1
+        chunk = _text_block(rng, 1024 * 1024)
+        for i in range(settings["large_files"]):
+            rel_path = f"large/big{i}.log"
+            with open(os.path.join(root_dir, "large", f"big{i}.log"), 'wb') as f:
+                for _ in range(settings["large_file_mb"]):
+                    f.write(chunk)
+            counters["files"] += 1
+            counters["bytes"] += settings["large_file_mb"] * len(chunk)
+            large_files.append(rel_path)
+        selected.extend(large_files)
+
+    description = {
+        "settings": settings,
+        "files": counters["files"],
+        "dirs": counters["dirs"],
+        "bytes": counters["bytes"],
+        "excluded_dirs": excluded,
+        "large_files": large_files,
+        "selected": selected,
+        "generate_seconds": round(time.perf_counter() - started_at, 3),
+    }
+    with open(tree_description_path(root_dir), 'w', encoding='utf-8') as f:
+        json.dump(description, f, indent=1)
+    return description
+
+def tree_description_path(root_dir):
+    return os.path.abspath(root_dir) + BENCH_TREE_SUFFIX
+
+def load_tree_description(root_dir):
+    with open(tree_description_path(root_dir), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# --- Running Tools ---
+def run_tool_in_process(tool, root_dir, work_dir, options):
+    """Runs one tool through the engine API and returns its counters (called in the child process)."""
+    import file_processor_engine as engine
+
+    description = load_tree_description(root_dir)
+    excluded_dirs_set = set(description["excluded_dirs"])
+    index_path = os.path.join(work_dir, engine.FILE_INDEX_FILENAME) if options["index"] else None
+    output_path = os.path.join(work_dir, f"{tool}.out")
+    job = engine.Job()
+    if tool == "extensions":
+        found_extensions_data, result = engine.scan_extensions(root_dir, excluded_dirs_set, job, index_path)
+        output_path = None
+    elif tool == "compile":
+        classifier = engine.ContentClassifier(not options["no_binary_detection"],
+                                              cache_path=os.path.join(work_dir, engine.FILE_INDEX_FILENAME))
+        result = engine.compile_sources(root_dir, output_path, set(), excluded_dirs_set, job,
+                                        incremental=options["incremental"], read_workers=options["read_threads"],
+                                        classifier=classifier)
+    elif tool == "export-paths":
+        result = engine.export_paths(root_dir, output_path, excluded_dirs_set, job, index_path)
+    else:
+        selection = engine.parse_selection_list("\n".join(description["selected"]))
+        result = engine.export_selected_files(root_dir, output_path, selection, job,
+                                              read_workers=options["read_threads"])
+    job.finish()
+    elapsed = job.rates()[0]
+    return {
+        "result": result,
+        "seconds": elapsed,
+        "files": job.files_done,
+        "bytes": job.bytes_done,
+        "output_bytes": os.path.getsize(output_path) if output_path else 0,
+        "phase_seconds": job.profile.phase_seconds(),
+    }
+
+def _peak_rss_bytes(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+def run_tool(tool, root_dir, work_dir, options):
+    """Runs one tool in a child process; returns its counters plus process wall time and peak RSS."""
+    cmd = [sys.executable, os.path.abspath(__file__), "_child", tool, root_dir, work_dir, json.dumps(options)]
+    started_at = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    stdout = proc.stdout.read()
+    proc.stdout.close()
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(proc.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        peak_rss = _peak_rss_bytes(rusage)
+        proc.returncode = returncode
+    else: # Windows: no per-child rusage
+        returncode = proc.wait()
+        peak_rss = None
+    process_seconds = time.perf_counter() - started_at
+    if returncode != 0:
+        raise RuntimeError(f"{tool} failed with exit status {returncode}")
+    run = json.loads(stdout)
+    run["process_seconds"] = process_seconds
+    run["peak_rss_bytes"] = peak_rss
+    return run
+
+def summarize_runs(runs):
+    seconds = statistics.median(run["seconds"] for run in runs)
+    files = runs[-1]["files"]
+    nbytes = runs[-1]["bytes"]
+    peak_rss = [run["peak_rss_bytes"] for run in runs if run["peak_rss_bytes"] is not None]
+    return {
+        "seconds": seconds,
+        "min_seconds": min(run["seconds"] for run in runs),
+        "files": files,
+        "bytes": nbytes,
+        "files_per_sec": files / seconds if seconds > 0 else 0.0,
+        "mb_per_sec": nbytes / (1024 * 1024) / seconds if seconds > 0 else 0.0,
+        "peak_rss_bytes": max(peak_rss) if peak_rss else None,
+        "runs": runs,
+    }
+
+def run_benchmarks(root_dir, tools, repeat, options, log=print):
+    """Runs each tool `repeat` times and returns the results document."""
+    description = load_tree_description(root_dir)
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tree": {key: description[key] for key in ("settings", "files", "dirs", "bytes")},
+        "options": options,
+        "tools": {},
+    }
+    # The index and content cache live in work_dir, so repeats after the first run warm
+    work_dir = tempfile.mkdtemp(prefix="file_processor_bench_")
+    try:
+        for tool in tools:
+            runs = []
+            for i in range(repeat):
+                run = run_tool(tool, os.path.abspath(root_dir), work_dir, options)
+                log(f"{tool} #{i + 1}: {format_run(run)}")
+                runs.append(run)
+            results["tools"][tool] = summarize_runs(runs)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def format_run(run):
+    seconds = run["seconds"]
+    rss = f"{run['peak_rss_bytes'] / (1024 * 1024):.0f} MB" if run.get("peak_rss_bytes") is not None else "n/a"
+    files_per_sec = run["files"] / seconds if seconds > 0 else 0.0
+    mb_per_sec = run["bytes"] / (1024 * 1024) / seconds if seconds > 0 else 0.0
+    return (f"{seconds:.3f}s, {run['files']} files ({files_per_sec:.0f}/s), "
+            f"{run['bytes'] / (1024 * 1024):.1f} MB ({mb_per_sec:.1f} MB/s), peak RSS {rss}")
+
+# --- Comparing Results ---
+def compare_results(base, new, threshold_pct):
+    """Returns (report lines, regressed tool names) for tools present in both result documents."""
+    lines = [f"{'tool':<16} {'base s':>9} {'new s':>9} {'change':>8} {'files/s':>10} {'MB/s':>8} {'RSS MB':>8}"]
+    regressed = []
+    for tool, new_summary in new["tools"].items():
+        base_summary = base["tools"].get(tool)
+        if base_summary is None:
+            continue
+        change_pct = ((new_summary["seconds"] / base_summary["seconds"]) - 1) * 100 if base_summary["seconds"] > 0 else 0.0
+        rss = new_summary["peak_rss_bytes"]
+        lines.append(f"{tool:<16} {base_summary['seconds']:>9.3f} {new_summary['seconds']:>9.3f} {change_pct:>+7.1f}%"
+                     f" {new_summary['files_per_sec']:>10.0f} {new_summary['mb_per_sec']:>8.1f}"
+                     f" {rss / (1024 * 1024) if rss is not None else float('nan'):>8.0f}")
+        if change_pct > threshold_pct:
+            regressed.append(tool)
+    if base["tree"] != new["tree"]:
+        lines.append("warning: the results were measured on different trees")
+    if base["options"] != new["options"]:
+        lines.append("warning: the results were measured with different options")
+    return lines, regressed
+
+# --- Command Line ---
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate benchmark trees, run the tools on them and compare results.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Create a synthetic tree.")
+    generate_parser.add_argument("root", help="Directory to create (must not exist).")
+    generate_parser.add_argument("--profile", choices=sorted(BENCH_PROFILES), default="quick")
+    for key, value in BENCH_DEFAULTS.items():
+        generate_parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=type(value), default=None,
+                                     help=f"Override the profile's {key} (default: {value}).")
+
+    run_parser = subparsers.add_parser("run", help="Run the tools on a generated tree.")
+    run_parser.add_argument("root")
+    run_parser.add_argument("-o", "--output", default="bench_results.json", help="Results file (JSON).")
+    run_parser.add_argument("--tools", default=",".join(TOOLS), help=f"Comma-separated subset of: {', '.join(TOOLS)}.")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Runs per tool; the median time is reported.")
+    run_parser.add_argument("--read-threads", type=int, default=1)
+    run_parser.add_argument("--index", action="store_true", help="Use the file index for walking tools.")
+    run_parser.add_argument("--incremental", action="store_true", help="Run compile in incremental mode.")
+    run_parser.add_argument("--no-binary-detection", action="store_true")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files.")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="Exit with status 1 if any tool got slower by more than this percentage.")
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "_child":
+        tool, root_dir, work_dir, options = argv[1:]
+        print(json.dumps(run_tool_in_process(tool, root_dir, work_dir, json.loads(options))))
+        return 0
+
+    args = build_parser().parse_args(argv)
+    if args.command == "generate":
+        settings = dict(BENCH_DEFAULTS, **BENCH_PROFILES[args.profile])
+        settings.update({key: getattr(args, key) for key in BENCH_DEFAULTS if getattr(args, key) is not None})
+        settings["profile"] = args.profile
+        if os.path.exists(args.root):
+            print(f"error: {args.root} already exists", file=sys.stderr)
+            return 1
+        description = generate_tree(args.root, settings)
+        print(f"Generated {description['files']} files in {description['dirs']} dirs"
+              f" ({description['bytes'] / (1024 * 1024):.1f} MB) in {description['generate_seconds']:.1f}s")
+        return 0
+
+    if args.command == "run":
+        tools = [tool.strip() for tool in args.tools.split(",") if tool.strip()]
+        unknown = [tool for tool in tools if tool not in TOOLS]
+        if unknown:
+            print(f"error: unknown tool(s): {', '.join(unknown)}", file=sys.stderr)
+            return 1
+        options = {"read_threads": args.read_threads, "index": args.index, "incremental": args.incremental,
+                   "no_binary_detection": args.no_binary_detection}
+        results = run_benchmarks(args.root, tools, args.repeat, options)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print(f"Results written to {os.path.abspath(args.output)}")
+        return 0
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    lines, regressed = compare_results(base, new, args.threshold)
+    print("\n".join(lines))
+    if regressed:
+        print(f"Slower by more than {args.threshold:.0f}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Command-line front end for the file processing engine (no tkinter needed).
+
+Examples:
+    python file_processor_cli.py compile path/to/root --exclude-dirs ".git, node_modules" --exclude-exts "png, jpg"
+    python file_processor_cli.py export-paths path/to/root -o paths.txt --gitignore
+    python file_processor_cli.py extensions path/to/root
+    git ls-files | python file_processor_cli.py export-selected path/to/root --list -
+    python file_processor_cli.py export-selected path/to/root --list selection.txt  # e.g. 'glob:src/**/*.py', 're:[.]md$'
+    python file_processor_cli.py compile path/to/root --compress gzip --shard-mb 256
+    python file_processor_cli.py extract compiled_sources.txt src/main.py
+
+Progress and status messages go to stderr; the exit status is 0 on success,
+1 on failure and 130 when interrupted.
+"""
+import argparse
+import os
+import sys
+
+import file_processor_engine as engine
+
+def _add_common_arguments(parser):
+    parser.add_argument("root", help="Root directory to process.")
+    parser.add_argument("-v", "--verbose", action="store_const", const=engine.LOG_DETAIL, dest="verbosity",
+                        default=engine.LOG_SUMMARY, help="Also show per-file messages.")
+    parser.add_argument("-q", "--quiet", action="store_const", const=engine.LOG_ERROR, dest="verbosity",
+                        help="Only show errors.")
+
+def _add_walk_arguments(parser, index=True):
+    parser.add_argument("--exclude-dirs", default="", metavar="DIRS",
+                        help="Comma-separated directories to skip, relative to the root (e.g. '.git, build/tmp').")
+    if index: # the compiler always lists directories afresh
+        parser.add_argument("--index", action="store_true",
+                            help=f"Record directory listings in {engine.FILE_INDEX_FILENAME} (working directory) and reuse unchanged ones.")
+    parser.add_argument("--gitignore", action="store_true",
+                        help="Skip files and directories matched by .gitignore / .ignore files in the tree.")
+
+def _add_read_arguments(parser):
+    parser.add_argument("--read-threads", type=int, default=1, metavar="N",
+                        help="Threads reading file contents ahead of the writer (default: 1).")
+
+def _add_output_format_arguments(parser):
+    parser.add_argument("--compress", choices=list(engine.BUNDLE_COMPRESSION_SUFFIXES), default="none",
+                        help="Compress the output in independent blocks, so the side index (<output>.index.json) still allows random access.")
+    parser.add_argument("--shard-mb", type=int, default=0, metavar="MB",
+                        help="Start a new output shard after about this many MB (0 = one file).")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Compile, list or export files under a root directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="Concatenate every non-excluded file into one output file.")
+    _add_common_arguments(compile_parser)
+    _add_walk_arguments(compile_parser, index=False)
+    _add_read_arguments(compile_parser)
+    _add_output_format_arguments(compile_parser)
+    compile_parser.add_argument("-o", "--output", default=engine.COMPILED_SOURCES_FILENAME)
+    compile_parser.add_argument("--exclude-exts", default="", metavar="EXTS",
+                                help="Comma-separated extensions to skip (e.g. 'log, tmp, png').")
+    compile_parser.add_argument("--incremental", action="store_true",
+                                help="Reuse segments of unchanged files from the previous output.")
+    compile_parser.add_argument("--dedup", action="store_true",
+                                help="Write each distinct file content once; later identical files become references.")
+    compile_parser.add_argument("--no-binary-detection", action="store_true",
+                                help="Include binary files' content instead of writing them path-only.")
+    compile_parser.add_argument("--max-size-kb", type=int, default=0, metavar="KB",
+                                help="Write files larger than this path-only (0 = no limit).")
+    compile_parser.add_argument("--size-rules", default="", metavar="RULES",
+                                help="Per-extension size limits in KB (e.g. 'log=1024, csv=10240').")
+
+    paths_parser = subparsers.add_parser("export-paths", help="List the relative path of every non-excluded file.")
+    _add_common_arguments(paths_parser)
+    _add_walk_arguments(paths_parser)
+    paths_parser.add_argument("-o", "--output", default=engine.EXPORTED_PATHS_FILENAME)
+
+    extensions_parser = subparsers.add_parser("extensions", help="List the file extensions found, with examples.")
+    _add_common_arguments(extensions_parser)
+    _add_walk_arguments(extensions_parser)
+
+    selected_parser = subparsers.add_parser("export-selected", help="Concatenate the files named or matched by a list.")
+    _add_common_arguments(selected_parser)
+    selected_parser.add_argument("--index", action="store_true",
+                                 help=f"Replay unchanged directories from {engine.FILE_INDEX_FILENAME} when matching patterns.")
+    _add_read_arguments(selected_parser)
+    _add_output_format_arguments(selected_parser)
+    selected_parser.add_argument("-o", "--output", default=engine.SELECTIVE_EXPORT_FILENAME)
+    selected_parser.add_argument("--list", required=True, metavar="FILE",
+                                 help="File with one relative path, 'glob:<pattern>' or 're:<regex>' per line ('-' reads standard input).")
+
+    extract_parser = subparsers.add_parser("extract", help="Print one file's entry from a compile/export-selected output.")
+    extract_parser.add_argument("output", help="Output path as given to compile/export-selected (e.g. compiled_sources.txt).")
+    extract_parser.add_argument("path", help="Relative path of the file whose entry to print.")
+    extract_parser.set_defaults(verbosity=engine.LOG_ERROR)
+    return parser
+
+def _read_selection(list_arg):
+    if list_arg == "-":
+        return engine.parse_selection_list(sys.stdin.read())
+    return engine.load_selection_file(list_arg)
+
+def run_command(args, job):
+    """Runs the parsed command on `job` and returns the message to print on success."""
+    if args.command == "extract":
+        with engine.open_bundle(args.output) as bundle:
+            if args.path not in bundle.entries:
+                raise ValueError(f"Not in {args.output}: {args.path}")
+            bundle.copy_segment(bundle.entries[args.path], sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+        return None
+    root_dir = args.root
+    if not os.path.isdir(root_dir):
+        raise ValueError(f"Root directory not found: {root_dir}")
+    index_path = os.path.join(os.getcwd(), engine.FILE_INDEX_FILENAME) if getattr(args, "index", False) else None
+    excluded_dirs_set = engine.parse_exclusions(getattr(args, "exclude_dirs", ""))
+    ignore_files = getattr(args, "gitignore", False)
+
+    if args.command == "compile":
+        classifier = engine.ContentClassifier(not args.no_binary_detection, args.max_size_kb * 1024,
+                                              engine.parse_size_rules(args.size_rules),
+                                              os.path.join(os.getcwd(), engine.FILE_INDEX_FILENAME))
+        digests = engine.DigestCache(os.path.join(os.getcwd(), engine.FILE_INDEX_FILENAME)) if args.dedup else None
+        count = engine.compile_sources(root_dir, args.output, engine.parse_exclusions(args.exclude_exts, True),
+                                       excluded_dirs_set, job, incremental=args.incremental,
+                                       read_workers=args.read_threads, classifier=classifier,
+                                       compression=args.compress, shard_bytes=args.shard_mb * 1024 * 1024, digests=digests,
+                                       ignore_files=ignore_files)
+        return f"Compiled {count} files into {os.path.abspath(args.output)}"
+    if args.command == "export-paths":
+        count = engine.export_paths(root_dir, args.output, excluded_dirs_set, job, index_path, ignore_files)
+        return f"Exported {count} paths to {os.path.abspath(args.output)}"
+    if args.command == "extensions":
+        return engine.format_extension_report(*engine.scan_extensions(root_dir, excluded_dirs_set, job, index_path, ignore_files))
+    selection = _read_selection(args.list)
+    files_processed, errors_encountered = engine.export_selected_files(root_dir, args.output, selection, job,
+                                                                       read_workers=args.read_threads, compression=args.compress,
+                                                                       shard_bytes=args.shard_mb * 1024 * 1024, index_path=index_path)
+    return (f"Exported {files_processed} files to {os.path.abspath(args.output)}"
+            f" ({errors_encountered} errors)")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "read_threads", 1) < 1:
+        print("error: --read-threads must be at least 1", file=sys.stderr)
+        return 1
+    if getattr(args, "shard_mb", 0) < 0:
+        print("error: --shard-mb must not be negative", file=sys.stderr)
+        return 1
+    if getattr(args, "max_size_kb", 0) < 0:
+        print("error: --max-size-kb must not be negative", file=sys.stderr)
+        return 1
+
+    def log_to_stderr(message, level):
+        if level <= args.verbosity:
+            print(message, file=sys.stderr)
+
+    job = engine.Job(log_to_stderr)
+    try:
+        message = run_command(args, job)
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    job.finish()
+    if message is None:
+        return 0
+    print(message)
+    if args.verbosity >= engine.LOG_SUMMARY:
+        print(engine.format_job_progress(job), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
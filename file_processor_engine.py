@@ -0,0 +1,1776 @@
+"""File processing engine behind the Tabbed File Processor.
+
+Walks a root directory and implements the Source Compiler, Path Exporter and
+Selective Exporter operations as plain functions. Nothing here imports
+tkinter, so the engine can run headless (see file_processor_cli.py) as well as
+under the GUI in code-compilers-pythonGUI.py.
+"""
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import heapq
+import io
+import json
+import lzma
+import os
+import re
+import sqlite3
+import stat
+import threading
+import time
+import zlib
+
+# Predefined output filenames (written to the current working directory by default)
+COMPILED_SOURCES_FILENAME = "compiled_sources.txt"
+EXPORTED_PATHS_FILENAME = "exported_paths.txt"
+SELECTIVE_EXPORT_FILENAME = "selectively_exported_files.txt"
+FILE_INDEX_FILENAME = ".file_index.sqlite3"
+
+# --- Helper Function ---
+def normalize_path(path_str):
+    """Normalizes path separators for consistent comparison."""
+    return path_str.replace('\\', '/').strip('/')
+
+def parse_exclusions(raw_str, is_extensions=False):
+    """Parses a comma-separated exclusion list into a set of '.ext' suffixes or normalized relative dirs."""
+    raw_list = raw_str.split(',')
+    if is_extensions:
+        return {f".{ext.strip().lstrip('.').lower()}" for ext in raw_list if ext.strip()}
+    else:
+        return {normalize_path(d.strip()) for d in raw_list if d.strip()}
+
+# Anything modified this close to a scan is re-checked next time, since a
+# second change within the same mtime tick would go unnoticed
+RACY_MTIME_WINDOW_NS = 2 * 10**9
+
+# --- Output Encoding ---
+# Content outputs are written in binary mode so byte offsets are exact. These
+# helpers reproduce what a text-mode 'utf-8'/'surrogateescape' round trip did:
+# universal newlines on read and os.linesep on write.
+OUTPUT_NEWLINE = os.linesep.encode('ascii')
+
+def normalize_newlines(data):
+    """Translates '\\r\\n' and '\\r' to '\\n' in raw file bytes, as text-mode reading does."""
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data
+
+def to_output_newlines(data):
+    if OUTPUT_NEWLINE != b'\n':
+        data = data.replace(b'\n', OUTPUT_NEWLINE)
+    return data
+
+def encode_output_text(text):
+    return to_output_newlines(text.encode('utf-8', 'surrogateescape'))
+
+# --- Logging Levels ---
+# A message is shown when its level <= the selected verbosity
+LOG_ERROR = 0
+LOG_SUMMARY = 1
+LOG_DETAIL = 2 # per-file lines
+
+# --- Jobs ---
+class JobCancelled(Exception):
+    """Raised inside an operation when its job has been cancelled."""
+
+class Job:
+    """Progress, logging and cancellation hooks that every operation reports through.
+
+    Operations call log(), add_progress() and, between files,
+    check_cancelled(). Log lines go to `log_sink(message, level)` (dropped
+    if it is None). The CLI uses this class directly; the GUI's BackgroundJob
+    subclass also runs the operation on a thread.
+    """
+    def __init__(self, log_sink=None):
+        self.log_sink = log_sink
+        self.cancel_event = threading.Event()
+        self.files_done = 0
+        self.bytes_done = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.profile = RunProfile()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def log(self, message, level=LOG_SUMMARY):
+        if self.log_sink is not None:
+            started_ns = time.perf_counter_ns()
+            self.log_sink(message, level)
+            self.profile.add("log", started_ns)
+
+    def add_progress(self, files=0, nbytes=0):
+        self.files_done += files
+        self.bytes_done += nbytes
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def rates(self):
+        """Returns (elapsed_seconds, files_per_sec, bytes_per_sec)."""
+        if self.started_at is None:
+            return 0.0, 0.0, 0.0
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        if elapsed <= 0:
+            return elapsed, 0.0, 0.0
+        return elapsed, self.files_done / elapsed, self.bytes_done / elapsed
+
+# --- Run Profiling ---
+PROFILE_TOP_N = 20
+PROFILE_REPORT_SUFFIX = ".profile.json" # latest run
+PROFILE_HISTORY_SUFFIX = ".profile-history.jsonl" # one line per run, for tracking over time
+
+class RunProfile:
+    """Accumulates per-phase, per-directory and per-file times for one run.
+
+    Operations charge spans to PHASES with add(started_ns), which returns
+    the end timestamp so consecutive spans can be chained. Reads on the
+    read-ahead threads go through timed_reader(), so "read" is summed over
+    threads and can exceed the wall time. `phase_probes` maps extra phase
+    names to callables returning nanoseconds spent elsewhere (e.g. the GUI's
+    status pane updates).
+    """
+    PHASES = ("walk", "exclude", "stat", "read", "decode", "hash", "write", "log")
+
+    def __init__(self, top_n=PROFILE_TOP_N):
+        self.top_n = top_n
+        self.phase_ns = dict.fromkeys(self.PHASES, 0)
+        self.phase_probes = {}
+        self.dir_ns = collections.defaultdict(int)
+        self.slowest_files = [] # min-heaps holding the top_n (ns, rel_path) / (size, rel_path)
+        self.largest_files = []
+        self.read_ns = {} # path -> ns of its read-ahead, until the file is done
+        self.lock = threading.Lock()
+        self.started_wall = time.time()
+
+    def add(self, phase, started_ns):
+        now_ns = time.perf_counter_ns()
+        self.phase_ns[phase] += now_ns - started_ns
+        return now_ns
+
+    def add_dir(self, phase, rel_dir, started_ns):
+        now_ns = self.add(phase, started_ns)
+        self.dir_ns[rel_dir] += now_ns - started_ns
+        return now_ns
+
+    def timed_reader(self, read_file):
+        """Wraps read_file so every read is timed, on whichever thread runs it."""
+        def read_and_time(path):
+            started_ns = time.perf_counter_ns()
+            try:
+                return read_file(path)
+            finally:
+                elapsed_ns = time.perf_counter_ns() - started_ns
+                with self.lock:
+                    self.phase_ns["read"] += elapsed_ns
+                    self.read_ns[path] = elapsed_ns
+        return read_and_time
+
+    def file_done(self, rel_path, size, started_ns, path=None):
+        """Records a file's time since started_ns, plus its read-ahead time if `path` was read by timed_reader()."""
+        elapsed_ns = time.perf_counter_ns() - started_ns
+        if path is not None:
+            with self.lock:
+                elapsed_ns += self.read_ns.pop(path, 0)
+        self.dir_ns[rel_path.rpartition('/')[0]] += elapsed_ns
+        self._keep_top(self.slowest_files, (elapsed_ns, rel_path))
+        if size is not None:
+            self._keep_top(self.largest_files, (size, rel_path))
+
+    def _keep_top(self, heap, item):
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def phase_seconds(self):
+        phase_seconds = {phase: elapsed_ns / 1e9 for phase, elapsed_ns in self.phase_ns.items()}
+        for phase, probe in self.phase_probes.items():
+            phase_seconds[phase] = probe() / 1e9
+        return phase_seconds
+
+    def report(self, job, tool, output_filepath):
+        elapsed, files_per_sec, bytes_per_sec = job.rates()
+        slowest_dirs = heapq.nlargest(self.top_n, self.dir_ns.items(), key=lambda item: item[1])
+        return {
+            "tool": tool,
+            "output": os.path.abspath(output_filepath),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_wall)),
+            "elapsed_seconds": elapsed,
+            "files": job.files_done,
+            "bytes": job.bytes_done,
+            "files_per_sec": files_per_sec,
+            "mb_per_sec": bytes_per_sec / (1024 * 1024),
+            "phase_seconds": self.phase_seconds(),
+            "slowest_files": [{"path": rel_path, "seconds": elapsed_ns / 1e9} for elapsed_ns, rel_path in sorted(self.slowest_files, reverse=True)],
+            "largest_files": [{"path": rel_path, "bytes": size} for size, rel_path in sorted(self.largest_files, reverse=True)],
+            "dirs_timed": len(self.dir_ns),
+            "slowest_dirs": [{"dir": rel_dir or ".", "seconds": elapsed_ns / 1e9} for rel_dir, elapsed_ns in slowest_dirs],
+        }
+
+def save_run_profile(job, tool, output_filepath):
+    """Writes the run's profile next to the output, appends it to the history file and logs a summary."""
+    report = job.profile.report(job, tool, output_filepath)
+    report_filepath = output_filepath + PROFILE_REPORT_SUFFIX
+    try:
+        with open(report_filepath, 'w', encoding='utf-8', errors='surrogateescape') as report_file:
+            json.dump(report, report_file, indent=1)
+        with open(output_filepath + PROFILE_HISTORY_SUFFIX, 'a', encoding='utf-8', errors='surrogateescape') as history_file:
+            history_file.write(json.dumps(report) + "\n")
+    except OSError as e:
+        job.log(f"Could not write profile report {report_filepath}: {e}", LOG_ERROR)
+        return report
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in report["phase_seconds"].items() if seconds >= 0.005)
+    job.log(f"Profile: {report['elapsed_seconds']:.2f}s total; {phases or 'no phase over 5 ms'}.")
+    if report["slowest_files"]:
+        slowest = report["slowest_files"][0]
+        job.log(f"Slowest file: {slowest['path']} ({slowest['seconds']:.3f}s)")
+    if report["largest_files"]:
+        largest = report["largest_files"][0]
+        job.log(f"Largest file: {largest['path']} ({largest['bytes']} bytes)")
+    job.log(f"Profile report: {report_filepath}")
+    return report
+
+# --- Ignore Files ---
+# With ignore files enabled, walk_tree honours .gitignore and .ignore files
+# anywhere in the tree, with git's rules: '!' re-includes, a pattern with a
+# '/' before its end is anchored to its file's directory (otherwise it matches
+# a name at any depth), a trailing '/' matches directories only, and '**/'
+# spans directories. Deeper files override shallower ones; within a directory
+# the last matching pattern wins, and .ignore overrides .gitignore. Like git,
+# the mode always skips .git itself, and drops pattern lines it cannot parse.
+IGNORE_FILENAMES = (".gitignore", ".ignore")
+GIT_DIR_NAME = ".git"
+IGNORE_GLOB_CHARS = frozenset("*?[\\")
+
+def parse_ignore_patterns(text):
+    """Returns [(glob, regex, negate, dir_only, basename_only)] for the patterns in an ignore file's text."""
+    patterns = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and stripped != line:
+            stripped += ' ' # an escaped trailing space is kept
+        line = stripped
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        basename_only = '/' not in line # e.g. '*.pyc' or 'build', as opposed to 'docs/build' or '/build'
+        glob = line.lstrip('/')
+        try:
+            patterns.append((glob, compile_glob(glob, escapes=True), negate, dir_only, basename_only))
+        except re.error:
+            continue # e.g. '[z-a]'; git skips such lines too
+    return patterns
+
+class IgnoreRules:
+    """The ignore patterns in effect in one directory, compiled once and shared by every directory below it.
+
+    `patterns` are this directory's own, matched against an entry's name
+    (patterns without a '/') or its path relative to the directory; `parent`
+    holds the rules of the directories above. Most entries match no pattern at
+    all, so the whole chain is also combined, per entry kind, into a set of
+    literal names, a tuple of '*<suffix>' suffixes, one regex for the other
+    name patterns and one root-relative path regex, which rule an entry out
+    without trying the patterns one by one.
+    """
+    def __init__(self, rel_dir, patterns, parent=None):
+        self.rel_dir = rel_dir
+        self.prefix_len = len(rel_dir) + 1 if rel_dir else 0
+        self.patterns = patterns[::-1] # last match wins
+        self.parent = parent
+        self.quick_checks = {}
+        for is_dir in (False, True):
+            literal_names = set()
+            suffixes = []
+            name_regexes = []
+            path_regexes = []
+            rules = self
+            while rules is not None:
+                base_regex = re.escape(rules.rel_dir + "/") if rules.rel_dir else ""
+                for glob, regex, _, dir_only, basename_only in rules.patterns:
+                    if dir_only and not is_dir:
+                        continue
+                    if not basename_only:
+                        path_regexes.append(base_regex + regex.pattern)
+                    elif not IGNORE_GLOB_CHARS.intersection(glob):
+                        literal_names.add(glob)
+                    elif glob.startswith('*') and not IGNORE_GLOB_CHARS.intersection(glob[1:]):
+                        suffixes.append(glob[1:])
+                    else:
+                        name_regexes.append(regex.pattern)
+                rules = rules.parent
+            self.quick_checks[is_dir] = (literal_names, tuple(suffixes),
+                                         re.compile("|".join(name_regexes)).match if name_regexes else None,
+                                         re.compile("|".join(path_regexes)).match if path_regexes else None)
+
+    def ignores(self, name, rel_path, is_dir):
+        """Returns True if the deepest directory with a matching pattern ignores the entry (its last match decides)."""
+        literal_names, suffixes, name_check, path_check = self.quick_checks[is_dir]
+        if not (name in literal_names or name.endswith(suffixes) or (name_check is not None and name_check(name))
+                or (path_check is not None and path_check(rel_path))):
+            return False
+        rules = self
+        while rules is not None:
+            sub_path = rel_path[rules.prefix_len:]
+            for _, regex, negate, dir_only, basename_only in rules.patterns:
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(name if basename_only else sub_path):
+                    return not negate
+            rules = rules.parent
+        return False
+
+def read_ignore_rules(dir_path, rel_dir, entries, parent=None):
+    """Returns the IgnoreRules in effect in a directory, given its listed entries and its parent's rules."""
+    present = {entry.name for entry in entries if entry.name in IGNORE_FILENAMES}
+    patterns = []
+    for filename in IGNORE_FILENAMES:
+        if filename not in present:
+            continue
+        try:
+            with open(os.path.join(dir_path, filename), 'r', encoding='utf-8-sig', errors='surrogateescape') as ignore_file:
+                patterns.extend(parse_ignore_patterns(ignore_file.read()))
+        except OSError:
+            pass # unreadable (or a directory): nothing to honour
+    return IgnoreRules(rel_dir, patterns, parent) if patterns else parent
+
+# --- Tree Walking ---
+def compile_exclusion_trie(excluded_dirs_set):
+    """Builds a trie of excluded relative directory paths, one level per path component.
+
+    Each node maps a directory name to the node for that directory; an excluded
+    directory maps to None because nothing below it is ever visited.
+    """
+    trie = {}
+    for ex_dir in excluded_dirs_set:
+        parts = [part for part in ex_dir.split('/') if part]
+        if not parts:
+            continue
+        node = trie
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is None: # an ancestor is already excluded
+                break
+        else:
+            node[parts[-1]] = None
+    return trie
+
+def scandir_list(dir_path, rel_dir):
+    """Default directory lister for walk_tree."""
+    with os.scandir(dir_path) as scandir_it:
+        return list(scandir_it)
+
+def walk_tree(root_dir, exclusion_trie=None, job=None, list_dir=scandir_list, ignore_files=False, skip_files=None):
+    """Yields (relative_path, DirEntry) for every file under root_dir, in os.walk order.
+
+    Works on os.scandir directly so the entry type cached by the directory
+    listing is reused, builds each relative path by appending one component to
+    its parent's, and prunes excluded directories by stepping through
+    exclusion_trie one component per level. Like os.walk, symlinked
+    directories are not followed and unreadable directories are skipped.
+    `list_dir(dir_path, rel_dir)` can be swapped out, e.g. for FileIndex.list_dir.
+    With `ignore_files`, entries matched by .gitignore/.ignore files found
+    along the way, and any .git, are skipped; ignored directories are never listed. The rule
+    files are spotted in the listing itself, so this costs no extra stat calls.
+    With a job, listing and filtering time go to its profile ("walk" and
+    "exclude"), per directory. `skip_files` is a (rel_dir, name regex) pair
+    from output_artifacts(); matching files in that one directory are left out.
+    """
+    profile = job.profile if job is not None else None
+    stack = [(root_dir, "", exclusion_trie or None, None)]
+    while stack:
+        dir_path, rel_dir, trie_node, ignore_rules = stack.pop()
+        if job is not None:
+            job.check_cancelled()
+        started_ns = time.perf_counter_ns()
+        try:
+            entries = list_dir(dir_path, rel_dir)
+        except OSError:
+            continue
+        if profile is not None:
+            started_ns = profile.add_dir("walk", rel_dir, started_ns)
+
+        if ignore_files:
+            ignore_rules = read_ignore_rules(dir_path, rel_dir, entries, ignore_rules)
+
+        files = []
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if ignore_files and (entry.name == GIT_DIR_NAME or (ignore_rules is not None and ignore_rules.ignores(entry.name, rel_path, is_dir))):
+                if is_dir and job is not None:
+                    job.log(f"Skipping ignored dir: {rel_path}", LOG_DETAIL)
+                continue
+            if not is_dir:
+                if skip_files is None or rel_dir != skip_files[0] or not skip_files[1].match(entry.name):
+                    files.append((rel_path, entry))
+                continue
+            child_node = None
+            if trie_node:
+                if entry.name in trie_node:
+                    child_node = trie_node[entry.name]
+                    if child_node is None:
+                        if job is not None:
+                            job.log(f"Skipping excluded dir: {rel_path}", LOG_DETAIL)
+                        continue
+            try:
+                if entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            subdirs.append((entry.path, rel_path, child_node, ignore_rules))
+        if profile is not None:
+            profile.add_dir("exclude", rel_dir, started_ns)
+        yield from files
+        stack.extend(reversed(subdirs))
+
+# --- Persistent File Index ---
+class IndexedEntry:
+    """Stands in for os.DirEntry when a directory listing is replayed from a FileIndex.
+
+    Only names and types are replayed. Rewriting a file does not change its
+    directory's mtime, so stat() always asks the file system.
+    """
+    __slots__ = ('dir_path', 'name', '_is_dir', '_is_symlink')
+
+    def __init__(self, dir_path, name, is_dir, is_symlink):
+        self.dir_path = dir_path
+        self.name = name
+        self._is_dir = is_dir
+        self._is_symlink = is_symlink
+
+    @property
+    def path(self):
+        return os.path.join(self.dir_path, self.name)
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+    def is_symlink(self):
+        return self._is_symlink
+
+    def stat(self):
+        return os.stat(self.path)
+
+def _index_blob(path_str):
+    # Paths are stored as bytes so undecodable (surrogate-escaped) names round-trip
+    return path_str.encode('utf-8', 'surrogatepass')
+
+def _index_str(blob):
+    return blob.decode('utf-8', 'surrogatepass')
+
+class FileIndex:
+    """SQLite cache of directory listings for one root directory.
+
+    Every directory visited through list_dir() is recorded with its mtime and
+    its entries (name and type). On later scans a directory
+    is only re-listed when its mtime has changed; otherwise its stored listing
+    is replayed, so a repeat scan of an unchanged tree costs one stat per
+    directory. Several roots can share one index file. The database runs in
+    WAL mode and each re-listed directory is committed on its own, so other
+    jobs using the same file are never locked out for longer than that.
+    """
+    SCHEMA_VERSION = 3 # PRAGMA user_version; older index tables are dropped and rebuilt
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            root BLOB NOT NULL, rel_dir BLOB NOT NULL, mtime_ns INTEGER NOT NULL,
+            PRIMARY KEY (root, rel_dir));
+        CREATE TABLE IF NOT EXISTS entries (
+            root BLOB NOT NULL, rel_dir BLOB NOT NULL, seq INTEGER NOT NULL,
+            name BLOB NOT NULL, is_dir INTEGER NOT NULL, is_symlink INTEGER NOT NULL,
+            PRIMARY KEY (root, rel_dir, seq));
+    """
+
+    def __init__(self, index_path, root_dir):
+        self.root_key = _index_blob(os.path.abspath(root_dir))
+        self.conn = sqlite3.connect(index_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") # a cache: losing the last commits on power loss is harmless
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.executescript(f"DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS entries; {self.SCHEMA}"
+                                    f"PRAGMA user_version = {self.SCHEMA_VERSION};")
+        else:
+            self.conn.executescript(self.SCHEMA)
+        self.dir_mtimes = dict(self.conn.execute("SELECT rel_dir, mtime_ns FROM dirs WHERE root = ?", (self.root_key,)))
+        self.scan_started_ns = time.time_ns()
+        self.dirs_relisted = 0
+        self.dirs_reused = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def list_dir(self, dir_path, rel_dir):
+        """walk_tree lister that replays the stored listing when the directory is unchanged."""
+        rel_key = _index_blob(rel_dir)
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+        if self.dir_mtimes.get(rel_key) == mtime_ns:
+            self.dirs_reused += 1
+            rows = self.conn.execute("SELECT name, is_dir, is_symlink FROM entries"
+                                     " WHERE root = ? AND rel_dir = ? ORDER BY seq", (self.root_key, rel_key)).fetchall()
+            return [IndexedEntry(dir_path, name_blob.decode('utf-8', 'surrogatepass'), is_dir, is_symlink)
+                    for name_blob, is_dir, is_symlink in rows]
+
+        with os.scandir(dir_path) as scandir_it:
+            entries = list(scandir_it)
+        self.dirs_relisted += 1
+        self._record_listing(rel_dir, rel_key, mtime_ns, entries)
+        return entries
+
+    def _record_listing(self, rel_dir, rel_key, mtime_ns, entries):
+        rows = []
+        subdir_names = set()
+        for seq, entry in enumerate(entries):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            try:
+                is_symlink = entry.is_symlink()
+            except OSError:
+                is_symlink = False
+            if is_dir:
+                subdir_names.add(entry.name)
+            rows.append((self.root_key, rel_key, seq, _index_blob(entry.name), int(is_dir), int(is_symlink)))
+
+        # Forget the subtrees of directories that have disappeared from this listing
+        old_subdirs = self.conn.execute("SELECT name FROM entries WHERE root = ? AND rel_dir = ? AND is_dir = 1", (self.root_key, rel_key))
+        for (name_blob,) in old_subdirs.fetchall():
+            if _index_str(name_blob) not in subdir_names:
+                self._forget_subtree(rel_dir, _index_str(name_blob))
+
+        self.conn.execute("DELETE FROM entries WHERE root = ? AND rel_dir = ?", (self.root_key, rel_key))
+        self.conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if self.scan_started_ns - mtime_ns < RACY_MTIME_WINDOW_NS:
+            mtime_ns = -1
+        self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (self.root_key, rel_key, mtime_ns))
+        self.conn.commit() # never hold the write lock while the walk yields this directory's files
+        self.dir_mtimes[rel_key] = mtime_ns
+
+    def _forget_subtree(self, rel_dir, name):
+        subtree_key = _index_blob(f"{rel_dir}/{name}" if rel_dir else name)
+        # Every rel_dir below subtree_key sorts between "<key>/" and "<key>0" ('0' follows '/')
+        for table in ("dirs", "entries"):
+            self.conn.execute(f"DELETE FROM {table} WHERE root = ? AND (rel_dir = ? OR (rel_dir >= ? AND rel_dir < ?))",
+                              (self.root_key, subtree_key, subtree_key + b'/', subtree_key + b'0'))
+
+@contextlib.contextmanager
+def open_file_index(index_path, root_dir):
+    """Yields a FileIndex for root_dir, or None when index_path is None."""
+    if index_path is None:
+        yield None
+        return
+    file_index = FileIndex(index_path, root_dir)
+    try:
+        yield file_index
+    finally:
+        file_index.close()
+
+def walk_root(root_dir, excluded_dirs_set, job, file_index=None, ignore_files=False, output_filepath=None):
+    """walk_tree over root_dir with the given exclusions, replaying unchanged directories from file_index if given.
+
+    With output_filepath, the files the run writes there are not walked.
+    """
+    list_dir = file_index.list_dir if file_index is not None else scandir_list
+    skip_files = output_artifacts(root_dir, output_filepath) if output_filepath is not None else None
+    return walk_tree(root_dir, compile_exclusion_trie(excluded_dirs_set), job, list_dir, ignore_files, skip_files)
+
+def output_artifacts(root_dir, output_filepath):
+    """Returns (rel_dir, name regex) for the files a run writing output_filepath creates, or None if they are outside root_dir.
+
+    The regex covers the output, its shards, the manifest, index and profile
+    files next to it, and the '.tmp' files all of these are built in, so an
+    output inside the tree being walked is never read back into itself.
+    """
+    out_dir, base = os.path.split(os.path.realpath(output_filepath))
+    try:
+        rel_dir = os.path.relpath(out_dir, os.path.realpath(root_dir))
+    except ValueError: # another drive
+        return None
+    if rel_dir == os.pardir or rel_dir.startswith(os.pardir + os.sep):
+        return None
+    rel_dir = "" if rel_dir == os.curdir else normalize_path(rel_dir)
+    compression_suffixes = "|".join(re.escape(suffix) for suffix in BUNDLE_COMPRESSION_SUFFIXES.values() if suffix)
+    side_suffixes = "|".join(re.escape(suffix) for suffix in (COMPILE_MANIFEST_SUFFIX, BUNDLE_INDEX_SUFFIX,
+                                                             PROFILE_REPORT_SUFFIX, PROFILE_HISTORY_SUFFIX))
+    return rel_dir, re.compile(rf"{re.escape(base)}(?:\.\d{{3}})?(?:{compression_suffixes})?(?:{side_suffixes})?(?:\.tmp)?\Z")
+
+def log_index_summary(file_index, job):
+    if file_index is not None:
+        job.log(f"File index: {file_index.dirs_reused} dir(s) reused, {file_index.dirs_relisted} re-listed.")
+
+# --- Incremental Compile Manifest ---
+COMPILE_MANIFEST_SUFFIX = ".manifest.json"
+COMPILE_MANIFEST_VERSION = 2
+
+def load_compile_manifest(output_filepath, settings):
+    """Returns ({rel_path: [*segment locator, size, mtime_ns, sha1]}, output file names) from the previous run.
+
+    Returns ({}, []) (forcing a full rebuild) when there is no manifest, it was
+    written with different settings, or the output files no longer match it.
+    """
+    try:
+        with open(output_filepath + COMPILE_MANIFEST_SUFFIX, 'r', encoding='utf-8', errors='surrogateescape') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("version") != COMPILE_MANIFEST_VERSION or manifest.get("settings") != settings:
+            return {}, []
+        output_dir = os.path.dirname(output_filepath)
+        for name, size, mtime_ns in manifest["outputs"]:
+            output_stat = os.stat(os.path.join(output_dir, name))
+            if [output_stat.st_size, output_stat.st_mtime_ns] != [size, mtime_ns]:
+                return {}, []
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, []
+    return manifest.get("entries", {}), [name for name, _, _ in manifest["outputs"]]
+
+def save_compile_manifest(output_filepath, settings, entries, output_paths):
+    outputs = []
+    for path in output_paths:
+        output_stat = os.stat(path)
+        outputs.append([os.path.basename(path), output_stat.st_size, output_stat.st_mtime_ns])
+    manifest = {
+        "version": COMPILE_MANIFEST_VERSION,
+        "settings": settings,
+        "outputs": outputs,
+        "entries": entries,
+    }
+    manifest_filepath = output_filepath + COMPILE_MANIFEST_SUFFIX
+    with open(manifest_filepath + ".tmp", 'w', encoding='utf-8', errors='surrogateescape') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_filepath + ".tmp", manifest_filepath)
+
+# --- Streaming Copies ---
+# Files above the threshold bypass read-ahead and are copied in fixed-size chunks
+STREAM_THRESHOLD_BYTES = 8 * 1024 * 1024
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+def stream_normalized_copy(path, outfile, hasher=None, chunk_size=STREAM_CHUNK_BYTES):
+    """Copies a file into outfile chunk by chunk, with the same newline translation as a whole-file read.
+
+    A trailing '\\r' is held back until the next chunk shows whether it starts
+    a '\\r\\n' pair. Chunks without '\\r' are written as read (with no decoding).
+    Only the bytes present when the file is opened are copied. `hasher`
+    receives the raw bytes. Returns (bytes_read, ends_with_newline).
+    """
+    bytes_read = 0
+    ends_with_newline = True # an empty file needs no extra newline
+    held_cr = False
+    with open(path, 'rb') as infile_content:
+        # Stop at the size seen on opening, so a file that keeps growing (such as this run's own output) still ends
+        remaining = os.fstat(infile_content.fileno()).st_size
+        while remaining > 0:
+            chunk = infile_content.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            bytes_read += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            if held_cr:
+                chunk = b'\r' + chunk
+            held_cr = chunk.endswith(b'\r')
+            if held_cr:
+                chunk = chunk[:-1]
+            if chunk:
+                chunk = normalize_newlines(chunk)
+                outfile.write(to_output_newlines(chunk))
+                ends_with_newline = chunk.endswith(b'\n')
+    if held_cr:
+        outfile.write(OUTPUT_NEWLINE)
+        ends_with_newline = True
+    return bytes_read, ends_with_newline
+
+def copy_byte_range(infile, offset, length, outfile, chunk_size=STREAM_CHUNK_BYTES):
+    """Copies `length` bytes starting at `offset` of infile into outfile in chunks."""
+    infile.seek(offset)
+    while length > 0:
+        chunk = infile.read(min(chunk_size, length))
+        if not chunk:
+            raise OSError(f"Unexpected end of file while copying {length} more byte(s)")
+        outfile.write(chunk)
+        length -= len(chunk)
+
+# --- Output Bundles ---
+# Content outputs can be compressed and split into shards. Every entry is a
+# segment whose locator, [shard, member_offset, inner_offset, length], says
+# where it starts: compressed shards are a series of independent gzip/xz
+# members of about BUNDLE_BLOCK_BYTES (uncompressed) each, so reading one
+# segment only decompresses from the start of its member. Uncompressed shards
+# use inner_offset 0 and member_offset as the byte offset.
+BUNDLE_COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "xz": ".xz"}
+BUNDLE_INDEX_SUFFIX = ".index.json"
+BUNDLE_INDEX_VERSION = 1
+BUNDLE_BLOCK_BYTES = 1024 * 1024
+BUNDLE_GZIP_LEVEL = 6 # gzip's own default
+BUNDLE_XZ_PRESET = 1 # xz's default preset 6 manages only about 1 MB/s
+
+def bundle_shard_path(output_filepath, compression, shard_bytes, shard):
+    """Returns the path of one shard: 'out.txt', 'out.txt.gz', or 'out.txt.000.gz' once sharding is on."""
+    suffix = BUNDLE_COMPRESSION_SUFFIXES[compression]
+    if shard_bytes:
+        return f"{output_filepath}.{shard:03d}{suffix}"
+    return output_filepath + suffix
+
+class BundleWriter:
+    """Writes a content output as one or more shards, optionally compressed, and records each segment's locator.
+
+    Segments are written between begin_segment() and end_segment(). Shards go
+    to temp files, which commit() renames into place (writing the side index,
+    also for plain output) and abort() removes. A segment never
+    spans shards, so a shard can exceed `shard_bytes` by up to one segment.
+    """
+    def __init__(self, output_filepath, compression="none", shard_bytes=0):
+        if compression not in BUNDLE_COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.output_filepath = output_filepath
+        self.compression = compression
+        self.shard_bytes = shard_bytes
+        self.shard_paths = []
+        self.segments = {} # key -> locator; the first segment wins for repeated keys
+        self.raw_file = None
+        self.shard_offset = 0
+        self.compressor = None
+        self.member_offset = 0
+        self.member_length = 0
+        self.segment_key = None
+        self.segment_start = 0
+
+    def is_bundle(self):
+        return self.compression != "none" or bool(self.shard_bytes)
+
+    def _open_shard(self):
+        path = bundle_shard_path(self.output_filepath, self.compression, self.shard_bytes, len(self.shard_paths))
+        self.raw_file = open(path + ".tmp", 'wb')
+        self.shard_paths.append(path)
+        self.shard_offset = 0
+
+    def _close_member(self):
+        if self.compressor is not None:
+            self._write_raw(self.compressor.flush())
+            self.compressor = None
+
+    def _close_shard(self):
+        self._close_member()
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_file = None
+
+    def _write_raw(self, data):
+        self.raw_file.write(data)
+        self.shard_offset += len(data)
+
+    def begin_segment(self, key):
+        if self.raw_file is None:
+            self._open_shard()
+        if self.compressor is None:
+            self.member_offset = self.shard_offset
+            self.member_length = 0
+            if self.compression == "gzip":
+                self.compressor = zlib.compressobj(BUNDLE_GZIP_LEVEL, zlib.DEFLATED, 31)
+            elif self.compression == "xz":
+                self.compressor = lzma.LZMACompressor(lzma.FORMAT_XZ, preset=BUNDLE_XZ_PRESET)
+        self.segment_key = key
+        self.segment_start = self.member_length
+
+    def write(self, data):
+        if self.compressor is not None:
+            self._write_raw(self.compressor.compress(data))
+        else:
+            self._write_raw(data)
+        self.member_length += len(data)
+
+    def end_segment(self):
+        """Finishes the current segment and returns its locator."""
+        locator = [len(self.shard_paths) - 1, self.member_offset, self.segment_start, self.member_length - self.segment_start]
+        self.segments.setdefault(self.segment_key, locator)
+        if self.compressor is None or self.member_length >= BUNDLE_BLOCK_BYTES:
+            self._close_member()
+            self.member_length = 0
+        if self.shard_bytes and self.shard_offset >= self.shard_bytes:
+            self._close_shard()
+        return locator
+
+    def commit(self):
+        """Renames the shards into place, drops stale shards of a previous run and writes the index."""
+        if not self.shard_paths:
+            self._open_shard() # an empty output is still written
+        self._close_shard()
+        for path in self.shard_paths:
+            os.replace(path + ".tmp", path)
+        shard = len(self.shard_paths)
+        while self.shard_bytes and os.path.exists(bundle_shard_path(self.output_filepath, self.compression, self.shard_bytes, shard)):
+            os.remove(bundle_shard_path(self.output_filepath, self.compression, self.shard_bytes, shard))
+            shard += 1
+        index_filepath = self.output_filepath + BUNDLE_INDEX_SUFFIX
+        index = {
+            "version": BUNDLE_INDEX_VERSION,
+            "compression": self.compression,
+            "shards": [os.path.basename(path) for path in self.shard_paths],
+            "entries": self.segments,
+        }
+        with open(index_filepath + ".tmp", 'w', encoding='utf-8', errors='surrogateescape') as index_file:
+            json.dump(index, index_file)
+        os.replace(index_filepath + ".tmp", index_filepath)
+
+    def abort(self):
+        self.compressor = None
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_file = None
+        for path in self.shard_paths:
+            with contextlib.suppress(OSError):
+                os.remove(path + ".tmp")
+
+def iter_member_bytes(infile, compression, chunk_size=STREAM_CHUNK_BYTES):
+    """Yields the decompressed bytes of the gzip/xz member at infile's position, at most chunk_size at a time."""
+    if compression == "gzip":
+        decompressor = zlib.decompressobj(31)
+    else:
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+    while not decompressor.eof:
+        if compression == "gzip":
+            data = decompressor.unconsumed_tail or infile.read(chunk_size)
+        else:
+            data = infile.read(chunk_size) if decompressor.needs_input else b''
+        decompressed = decompressor.decompress(data, chunk_size)
+        if not data and not decompressed and not decompressor.eof:
+            raise OSError("Unexpected end of compressed data")
+        yield decompressed
+
+class MemberCursor:
+    """Reads forward through one decompressed member, so segments read in order decompress it only once."""
+    def __init__(self, shard, member_offset, chunks):
+        self.shard = shard
+        self.member_offset = member_offset
+        self.chunks = chunks
+        self.position = 0 # member offset of pending[pending_pos]
+        self.pending = b''
+        self.pending_pos = 0
+
+    def copy(self, inner_offset, length, outfile):
+        end = inner_offset + length
+        while self.position < end:
+            if self.pending_pos == len(self.pending):
+                self.pending = next(self.chunks, None)
+                self.pending_pos = 0
+                if self.pending is None:
+                    raise OSError(f"Unexpected end of compressed member while reading {end - self.position} more byte(s)")
+                continue
+            take = min(len(self.pending) - self.pending_pos, end - self.position)
+            skip = max(0, inner_offset - self.position)
+            if skip < take:
+                outfile.write(self.pending[self.pending_pos + skip:self.pending_pos + take])
+            self.pending_pos += take
+            self.position += take
+
+class BundleReader:
+    """Reads single segments back out of an output written by BundleWriter.
+
+    Use open_bundle() to load the side index of an output (plain, compressed
+    or sharded); read_segment() then returns one entry without scanning the rest.
+    """
+    def __init__(self, base_dir, shard_names, compression, entries=None):
+        self.base_dir = base_dir
+        self.shard_names = shard_names
+        self.compression = compression
+        self.entries = entries if entries is not None else {}
+        self.shard_files = {}
+        self.cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.cursor = None
+        for shard_file in self.shard_files.values():
+            shard_file.close()
+        self.shard_files.clear()
+
+    def paths(self):
+        return list(self.entries)
+
+    def _shard_file(self, shard):
+        if shard not in self.shard_files:
+            self.shard_files[shard] = open(os.path.join(self.base_dir, self.shard_names[shard]), 'rb')
+        return self.shard_files[shard]
+
+    def copy_segment(self, locator, outfile):
+        """Writes the segment at `locator` to outfile in chunks."""
+        shard, member_offset, inner_offset, length = locator
+        shard_file = self._shard_file(shard)
+        if self.compression == "none":
+            copy_byte_range(shard_file, member_offset + inner_offset, length, outfile)
+            return
+        cursor = self.cursor
+        if cursor is None or (cursor.shard, cursor.member_offset) != (shard, member_offset) or cursor.position > inner_offset:
+            shard_file.seek(member_offset)
+            cursor = self.cursor = MemberCursor(shard, member_offset, iter_member_bytes(shard_file, self.compression))
+        cursor.copy(inner_offset, length, outfile)
+
+    def read_segment(self, rel_path):
+        """Returns the whole output entry (header, content and end marker) for rel_path. Raises KeyError if absent."""
+        segment = io.BytesIO()
+        self.copy_segment(self.entries[rel_path], segment)
+        return segment.getvalue()
+
+def log_bundle_summary(bundle_writer, job):
+    index_filepath = bundle_writer.output_filepath + BUNDLE_INDEX_SUFFIX
+    if bundle_writer.is_bundle():
+        job.log(f"Output: {len(bundle_writer.shard_paths)} shard(s) ({bundle_writer.compression}), index: {index_filepath}")
+    else:
+        job.log(f"Output index: {index_filepath}", LOG_DETAIL)
+
+def open_bundle(output_filepath):
+    """Loads the side index written next to an output and returns a BundleReader."""
+    with open(output_filepath + BUNDLE_INDEX_SUFFIX, 'r', encoding='utf-8', errors='surrogateescape') as index_file:
+        index = json.load(index_file)
+    if index.get("version") != BUNDLE_INDEX_VERSION:
+        raise ValueError(f"Unsupported bundle index version: {index.get('version')}")
+    return BundleReader(os.path.dirname(output_filepath), index["shards"], index["compression"], index["entries"])
+
+# --- Parallel Read-Ahead ---
+READ_AHEAD_MAX_BYTES = 64 * 1024 * 1024
+READ_AHEAD_MAX_ITEMS_PER_WORKER = 64
+
+def read_source_file(path):
+    with open(path, 'rb') as infile_content:
+        return infile_content.read()
+
+def read_unless_large(path):
+    """Like read_source_file, but returns None without reading when fstat reports more than STREAM_THRESHOLD_BYTES."""
+    with open(path, 'rb') as infile_content:
+        if os.fstat(infile_content.fileno()).st_size > STREAM_THRESHOLD_BYTES:
+            return None
+        return infile_content.read()
+
+def read_ahead(items, read_file, workers=1, max_inflight_bytes=READ_AHEAD_MAX_BYTES):
+    """Yields (key, outcome) for each (key, path, size_hint) in `items`, in the same order.
+
+    outcome is read_file(path), the exception it raised, or None when path is
+    None. With workers > 1 the reads run on a thread pool ahead of the
+    consumer, until roughly `max_inflight_bytes` (by size_hint) of unconsumed
+    data or READ_AHEAD_MAX_ITEMS_PER_WORKER items per worker are pending. A
+    size_hint of None means the size is not known up front: at most `workers`
+    such reads run at a time, and each then counts with the length of what
+    it returned.
+    """
+    if workers <= 1:
+        for key, path, _ in items:
+            if path is None:
+                yield key, None
+                continue
+            try:
+                yield key, read_file(path)
+            except Exception as e_read:
+                yield key, e_read
+        return
+
+    items = iter(items)
+    pending = collections.deque() # (key, future or None, size_hint)
+    max_pending_items = workers * READ_AHEAD_MAX_ITEMS_PER_WORKER
+    inflight_bytes = 0
+    # For items without a size hint: [bytes returned but not yet consumed, reads still running]
+    unhinted = [0, 0]
+    unhinted_lock = threading.Lock()
+
+    def count_unhinted(future):
+        outcome = future.result() if not future.cancelled() and future.exception() is None else None
+        with unhinted_lock:
+            unhinted[0] += len(outcome) if outcome is not None else 0
+            unhinted[1] -= 1
+
+    exhausted = False
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="read-ahead")
+    try:
+        while True:
+            # Always keep at least one item pending so a single huge file still goes through
+            while not exhausted and (not pending or (inflight_bytes + unhinted[0] < max_inflight_bytes and unhinted[1] < workers
+                                                     and len(pending) < max_pending_items)):
+                try:
+                    key, path, size_hint = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = pool.submit(read_file, path) if path is not None else None
+                if size_hint is None:
+                    if future is not None:
+                        with unhinted_lock:
+                            unhinted[1] += 1
+                        future.add_done_callback(count_unhinted)
+                else:
+                    inflight_bytes += size_hint
+                pending.append((key, future, size_hint))
+            if not pending:
+                break
+            key, future, size_hint = pending.popleft()
+            if size_hint is not None:
+                inflight_bytes -= size_hint
+            if future is None:
+                yield key, None
+                continue
+            try:
+                outcome = future.result()
+            except Exception as e_read:
+                yield key, e_read
+                continue
+            if size_hint is None and outcome is not None:
+                with unhinted_lock:
+                    unhinted[0] -= len(outcome)
+            yield key, outcome
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# --- Per-File Caches ---
+class FileValueCache:
+    """One value per file, valid while the file's size and mtime are unchanged, in an SQLite table.
+
+    The connection is opened on first use, so it belongs to the job thread;
+    new rows are written in one transaction at close(), and files modified
+    within RACY_MTIME_WINDOW_NS of the run's start are not recorded. A
+    cache_path of None disables caching. If the database is locked or
+    unusable, the cache is dropped for the rest of the run and `error` says
+    why; callers simply see misses.
+    """
+    def __init__(self, cache_path, table, value_column):
+        self.cache_path = cache_path
+        self.table = table
+        self.schema = (f"CREATE TABLE IF NOT EXISTS {table} ("
+                       f"path BLOB PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, {value_column} TEXT NOT NULL);")
+        self.select_sql = f"SELECT size, mtime_ns, {value_column} FROM {table} WHERE path = ?"
+        self.conn = None
+        self.pending_rows = []
+        self.started_ns = time.time_ns()
+        self.hits = 0
+        self.error = None
+
+    def _connect(self):
+        if self.conn is None and self.cache_path is not None:
+            try:
+                self.conn = sqlite3.connect(self.cache_path, timeout=30)
+                self.conn.executescript(self.schema)
+            except sqlite3.Error as e:
+                self._drop(e)
+        return self.conn
+
+    def _drop(self, error):
+        """Stops using the database for the rest of the run."""
+        self.error = error
+        self.cache_path = None
+        self.pending_rows = []
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get(self, path, size, mtime_ns):
+        """Returns the recorded value for an unchanged file, or None."""
+        if size is None or self._connect() is None:
+            return None
+        try:
+            row = self.conn.execute(self.select_sql, (_index_blob(path),)).fetchone()
+        except sqlite3.Error as e:
+            self._drop(e)
+            return None
+        if row is not None and row[0] == size and row[1] == mtime_ns:
+            self.hits += 1
+            return row[2]
+        return None
+
+    def put(self, path, size, mtime_ns, value):
+        if self.cache_path is not None and size is not None and self.started_ns - mtime_ns >= RACY_MTIME_WINDOW_NS:
+            self.pending_rows.append((_index_blob(path), size, mtime_ns, value))
+
+    def close(self):
+        try:
+            if self.pending_rows and self._connect() is not None:
+                self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)", self.pending_rows)
+                self.pending_rows = []
+            if self.conn is not None:
+                self.conn.commit()
+        except sqlite3.Error as e:
+            self._drop(e)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# --- Content Classification ---
+CONTENT_TEXT = "text"
+CONTENT_BINARY = "binary"
+SNIFF_BYTES = 8192
+# A sniffed block is binary if it holds a NUL byte or more than this share of invalid UTF-8 bytes
+MAX_INVALID_UTF8_RATIO = 0.3
+_ESCAPED_BYTE_RE = re.compile('[\udc80-\udcff]')
+
+def sniff_content_class(head):
+    """Classifies a file as CONTENT_TEXT or CONTENT_BINARY from its first block of bytes."""
+    if b'\x00' in head:
+        return CONTENT_BINARY
+    # An incremental decoder holds back a multi-byte sequence cut off at the end of the block
+    text = codecs.getincrementaldecoder('utf-8')(errors='surrogateescape').decode(head, final=False)
+    invalid_bytes = len(_ESCAPED_BYTE_RE.findall(text))
+    if head and invalid_bytes / len(head) > MAX_INVALID_UTF8_RATIO:
+        return CONTENT_BINARY
+    return CONTENT_TEXT
+
+def read_head(path, size=SNIFF_BYTES):
+    with open(path, 'rb') as infile_content:
+        return infile_content.read(size)
+
+def parse_size_rules(rules_str):
+    """Parses "ext=KB, ext=KB" into {'.ext': bytes}. Raises ValueError on malformed rules."""
+    size_rules = {}
+    for rule in rules_str.split(','):
+        if not rule.strip():
+            continue
+        ext, sep, size_kb = rule.partition('=')
+        ext = ext.strip().lstrip('.').lower()
+        if not sep or not ext:
+            raise ValueError(f"Size rule '{rule.strip()}' is not in the form ext=KB")
+        size_kb = int(size_kb.strip())
+        if size_kb < 0:
+            raise ValueError(f"Size rule '{rule.strip()}' must not be negative")
+        size_rules[f".{ext}"] = size_kb * 1024
+    return size_rules
+
+class ContentClassifier:
+    """Decides which files the compiler writes path-only: binary content or over a size limit.
+
+    Size limits come from `max_size_bytes` (0 = none) and per-extension
+    `size_rules` ({'.log': bytes}, 0 = none for that extension). Sniff
+    results are kept in a FileValueCache in `cache_path`, so unchanged files
+    are not re-sniffed on later runs, and known binaries are not even read.
+    """
+    def __init__(self, detect_binary=True, max_size_bytes=0, size_rules=None, cache_path=None):
+        self.detect_binary = detect_binary
+        self.max_size_bytes = max_size_bytes
+        self.size_rules = size_rules or {}
+        self.cache = FileValueCache(cache_path, "content_classes", "content_class")
+        self.sniffed = 0
+
+    def settings(self):
+        """The options that change output, for the incremental compile manifest."""
+        return {"detect_binary": self.detect_binary, "max_size_bytes": self.max_size_bytes, "size_rules": self.size_rules}
+
+    def size_limit(self, ext):
+        return self.size_rules.get(ext, self.max_size_bytes)
+
+    def is_oversize(self, ext, size):
+        limit = self.size_limit(ext)
+        return bool(limit) and size is not None and size > limit
+
+    def cached_class(self, path, size, mtime_ns):
+        """Returns the recorded class for an unchanged file, or None if it must be sniffed."""
+        if not self.detect_binary:
+            return None
+        return self.cache.get(path, size, mtime_ns)
+
+    def sniff(self, path, head, size, mtime_ns):
+        content_class = sniff_content_class(head)
+        self.sniffed += 1
+        self.cache.put(path, size, mtime_ns, content_class)
+        return content_class
+
+    def close(self):
+        self.cache.close()
+
+# --- Content Deduplication ---
+def hash_file(path, chunk_size=STREAM_CHUNK_BYTES):
+    """Returns the SHA-1 hex digest of a file's raw bytes, read in chunks."""
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as infile_content:
+        for chunk in iter(lambda: infile_content.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class DigestCache:
+    """Caches SHA-1 digests of file contents per (path, size, mtime) for the compiler's dedup mode.
+
+    A FileValueCache in `cache_path`, like ContentClassifier's. Known
+    digests let duplicates be skipped without reading them at all.
+    """
+    def __init__(self, cache_path=None):
+        self.cache = FileValueCache(cache_path, "content_digests", "sha1")
+        self.hashed = 0
+
+    def cached_digest(self, path, size, mtime_ns):
+        """Returns the recorded digest of an unchanged file, or None if it must be hashed."""
+        return self.cache.get(path, size, mtime_ns)
+
+    def record(self, path, size, mtime_ns, digest):
+        self.hashed += 1
+        self.cache.put(path, size, mtime_ns, digest)
+
+    def close(self):
+        self.cache.close()
+
+# --- Selection Lists ---
+# Selective export lists hold one literal relative path per line, or a pattern
+# matched against every file under the root: 'glob:src/**/*.py' ('*' and '?'
+# stay within one path component, '**/' spans any number of them) or
+# 're:<regex>' (searched in the '/'-separated relative path).
+SELECTION_GLOB_PREFIX = "glob:"
+SELECTION_REGEX_PREFIX = "re:"
+
+def compile_glob(pattern, escapes=False):
+    """Translates a '/'-separated glob pattern into a compiled regex that must match a whole relative path.
+
+    With `escapes`, a backslash makes the next character literal (as in .gitignore).
+    """
+    regex_parts = []
+    i = 0
+    while i < len(pattern):
+        if escapes and pattern[i] == "\\" and i + 1 < len(pattern):
+            regex_parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        elif pattern.startswith("**/", i):
+            regex_parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex_parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex_parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex_parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and pattern.find("]", i + 2) != -1:
+            end = pattern.find("]", i + 2) # a ']' right after '[' (or '[!') is part of the set
+            char_set = pattern[i + 1:end].replace("\\", "\\\\")
+            if char_set.startswith("!"):
+                char_set = "^" + char_set[1:]
+            regex_parts.append(f"[{char_set}]")
+            i = end + 1
+        else:
+            regex_parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(regex_parts) + r"\Z")
+
+def parse_selection_list(raw_text):
+    """Parses a selective export list into [(kind, text, compiled pattern or None)], kind being 'path', 'glob' or 'regex'.
+
+    Blank lines are skipped. Raises ValueError, naming the line, for an invalid glob or regex.
+    """
+    selection = []
+    for line_number, line in enumerate(raw_text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(SELECTION_GLOB_PREFIX):
+            pattern = normalize_path(line[len(SELECTION_GLOB_PREFIX):].strip())
+            try:
+                selection.append(("glob", pattern, compile_glob(pattern)))
+            except re.error as e:
+                raise ValueError(f"Line {line_number}: invalid glob {pattern!r}: {e}") from None
+        elif line.startswith(SELECTION_REGEX_PREFIX):
+            pattern = line[len(SELECTION_REGEX_PREFIX):].strip()
+            try:
+                selection.append(("regex", pattern, re.compile(pattern)))
+            except re.error as e:
+                raise ValueError(f"Line {line_number}: invalid regex {pattern!r}: {e}") from None
+        else:
+            selection.append(("path", normalize_path(line), None))
+    return selection
+
+def load_selection_file(path):
+    """Reads and parses a selection list file (UTF-8, one entry per line)."""
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as list_file:
+        return parse_selection_list(list_file.read())
+
+def _file_path(entry):
+    """Returns the full path of a listed entry that is a file, else None."""
+    try:
+        if entry.is_file():
+            return entry.path
+    except OSError:
+        pass
+    return None
+
+def _lookup_literal_paths(root_dir, rel_paths):
+    """Returns {rel_path: full path or None} using one directory listing per distinct parent directory.
+
+    Names missing from their parent's listing get a single os.stat() as a
+    fallback, so case-insensitive file systems and odd spellings still resolve.
+    """
+    listings = {}
+    found = {}
+    for rel_path in rel_paths:
+        parent, name = os.path.split(rel_path)
+        if parent not in listings:
+            try:
+                with os.scandir(os.path.join(root_dir, parent)) as scandir_it:
+                    listings[parent] = {entry.name: entry for entry in scandir_it}
+            except (OSError, ValueError):
+                listings[parent] = {}
+        entry = listings[parent].get(name)
+        if entry is not None:
+            found[rel_path] = _file_path(entry)
+            continue
+        full_path = os.path.join(root_dir, rel_path)
+        try:
+            st = os.stat(full_path)
+        except (OSError, ValueError):
+            st = None
+        found[rel_path] = full_path if st is not None and stat.S_ISREG(st.st_mode) else None
+    return found
+
+# A regex that starts with '^' and plain '/'-separated names only matches under those directories
+_REGEX_LITERAL_DIR = re.compile(r"\^((?:[\w-]|\\\.)+(?:/(?:[\w-]|\\\.)+)*)/(?![?*+{])")
+
+def _pattern_base_dir(kind, text):
+    """Returns the directory every path matched by a glob or regex rule lies under, or '' if that is not evident from its text."""
+    if kind == "glob":
+        literal = re.match(r"[^*?\[]*", text).group()
+    else:
+        literal_match = _REGEX_LITERAL_DIR.match(text) if "|" not in text else None
+        literal = literal_match.group(1).replace("\\.", ".") + "/" if literal_match else ""
+    return literal.rpartition("/")[0]
+
+def resolve_selection(root_dir, selection, job, file_index=None, output_filepath=None):
+    """Resolves parsed selection rules into [(rel_path, full path or None)] in list order, without duplicates.
+
+    Literal paths are looked up with one listing per parent directory and map
+    to None when they are not files. Patterns are all answered from a single
+    walk of the tree (replayed from file_index if given); each file is only
+    tested against the patterns whose literal directory prefix it lies under.
+    A path matched by several rules is exported once, at its first position.
+    Files written by a run to output_filepath are not matched by patterns.
+    Nothing is stat'ed here; sizes are left to the read.
+    """
+    literals = _lookup_literal_paths(root_dir, [text for kind, text, _ in selection if kind == "path"])
+    rules_by_dir = collections.defaultdict(list) # base dir -> [(rule index, match function)]
+    pattern_matches = {} # rule index -> [(rel_path, full path)] in walk order
+    for rule_index, (kind, text, compiled) in enumerate(selection):
+        if kind != "path":
+            rules_by_dir[_pattern_base_dir(kind, text)].append((rule_index, compiled.match if kind == "glob" else compiled.search))
+            pattern_matches[rule_index] = []
+    if pattern_matches:
+        rel_dir = None
+        for rel_path, entry in walk_root(root_dir, set(), job, file_index, output_filepath=output_filepath):
+            parent = rel_path.rpartition('/')[0]
+            if parent != rel_dir: # files arrive grouped by directory
+                rel_dir = parent
+                candidates = list(rules_by_dir.get("", ()))
+                if rel_dir:
+                    ancestor = ""
+                    for name in rel_dir.split('/'):
+                        ancestor = f"{ancestor}/{name}" if ancestor else name
+                        candidates.extend(rules_by_dir.get(ancestor, ()))
+            matching = [rule_index for rule_index, match in candidates if match(rel_path)]
+            if matching and _file_path(entry) is not None:
+                for rule_index in matching:
+                    pattern_matches[rule_index].append((rel_path, entry.path))
+
+    resolved = []
+    seen = set()
+    duplicates = 0
+    for rule_index, (kind, text, _) in enumerate(selection):
+        if kind == "path":
+            matches = [(text, literals[text])]
+        else:
+            matches = pattern_matches[rule_index]
+            job.log(f"Pattern '{text}' ({kind}) matched {len(matches)} file(s).", LOG_SUMMARY if matches else LOG_ERROR)
+        for rel_path, full_path in matches:
+            if rel_path in seen:
+                duplicates += 1
+                continue
+            seen.add(rel_path)
+            resolved.append((rel_path, full_path))
+    if duplicates:
+        job.log(f"Removed {duplicates} duplicate path(s) from the selection.")
+    return resolved
+
+# --- Operations (run on a job thread by the GUI, so they never touch Tk) ---
+def scan_extensions(root_dir, excluded_dirs_set, job, index_path=None, ignore_files=False):
+    """Returns ({ext: [up to 3 example paths]}, files_scanned)."""
+    found_extensions_data = {}
+    files_scanned = 0
+    with open_file_index(index_path, root_dir) as file_index:
+        for relative_path_normalized, entry in walk_root(root_dir, excluded_dirs_set, job, file_index, ignore_files):
+            files_scanned += 1
+            _, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext:
+                if ext not in found_extensions_data:
+                    found_extensions_data[ext] = []
+                if len(found_extensions_data[ext]) < 3:
+                    found_extensions_data[ext].append(relative_path_normalized)
+            job.add_progress(files=1)
+        log_index_summary(file_index, job)
+    return found_extensions_data, files_scanned
+
+class SourceFile:
+    """One walked file on its way through the compile pipeline."""
+    __slots__ = ('rel_path', 'path', 'size', 'mtime_ns', 'path_only_reason', 'content_class', 'previous', 'stream', 'digest')
+
+    def __init__(self, rel_path, path=None, size=None, mtime_ns=None):
+        self.rel_path = rel_path
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.path_only_reason = None # e.g. "ext excluded"; only the header is written
+        self.content_class = None # known from the classifier cache, else sniffed once read
+        self.previous = None # manifest entry when the previous output's segment is reused
+        self.stream = False # large files are streamed by the writer instead of read ahead
+        self.digest = None # SHA-1 of the raw bytes, in dedup mode
+
+def compile_sources(root_dir, output_filepath, excluded_extensions_set, excluded_dirs_set, job, incremental=False,
+                    read_workers=1, max_inflight_bytes=READ_AHEAD_MAX_BYTES, classifier=None, compression="none", shard_bytes=0,
+                    digests=None, ignore_files=False):
+    """Concatenates every non-excluded file under root_dir into output_filepath. Returns the entry count.
+
+    The output is built in a temp file and renamed into place. With
+    `incremental`, a manifest of every content segment is kept next to the
+    output, and files whose size and mtime are unchanged since the previous run
+    have their segment copied from the previous output instead of being re-read.
+    With read_workers > 1, file contents are read ahead on a thread pool; the
+    output is identical either way. Files larger than STREAM_THRESHOLD_BYTES
+    are streamed in chunks, so memory use does not grow with file size. A
+    ContentClassifier turns binary and oversize files into path-only entries.
+    `compression` ("none", "gzip" or "xz") and `shard_bytes` turn the output
+    into a bundle; either way a side index is written (see BundleWriter). With a DigestCache
+    as `digests`, a file whose bytes match a body already written is emitted
+    as a short reference to that file's entry instead. `ignore_files` makes
+    the walk honour .gitignore/.ignore files (see walk_tree).
+    """
+    settings = {"root_dir": os.path.abspath(root_dir), "excluded_extensions": sorted(excluded_extensions_set),
+                "content_rules": classifier.settings() if classifier is not None else None,
+                "output_format": [compression, shard_bytes], "dedup": digests is not None}
+    previous_entries, previous_outputs = load_compile_manifest(output_filepath, settings) if incremental else ({}, [])
+    manifest_entries = {}
+    compile_started_ns = time.time_ns()
+    files_processed_count = 0
+    reused_count = 0
+    path_only_count = 0
+    duplicate_count = 0
+    bytes_saved = 0
+    planned_bodies = {} # digest -> first rel_path, for digests known before reading
+    written_bodies = {} # digest -> rel_path whose full entry is in the output
+    profile = job.profile
+    outfile = BundleWriter(output_filepath, compression, shard_bytes)
+
+    def plan_source_file(source_file, entry, started_ns):
+        """Decides how the writer gets source_file's content. Returns (path to read ahead or None, span start)."""
+        _, ext = os.path.splitext(entry.name)
+        ext = ext.lower() # e.g., '.txt'
+
+        # Check if the extension is in the exclusion list
+        if excluded_extensions_set and ext in excluded_extensions_set:
+            source_file.path_only_reason = "ext excluded"
+            return None, started_ns
+
+        started_ns = profile.add("exclude", started_ns)
+        try:
+            st = entry.stat()
+            source_file.size, source_file.mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            pass # the read below will fail and report it
+        started_ns = profile.add("stat", started_ns)
+        if classifier is not None:
+            if classifier.is_oversize(ext, source_file.size):
+                source_file.path_only_reason = f"oversize, {source_file.size} bytes"
+                return None, started_ns
+            source_file.content_class = classifier.cached_class(entry.path, source_file.size, source_file.mtime_ns)
+            if source_file.content_class == CONTENT_BINARY:
+                source_file.path_only_reason = "binary"
+                return None, started_ns
+
+        previous = previous_entries.get(source_file.rel_path)
+        if previous is not None and source_file.size is not None and previous[4:6] == [source_file.size, source_file.mtime_ns]:
+            source_file.previous = previous
+        if digests is not None and source_file.size: # empty files are cheaper to write than to reference
+            started_ns = profile.add("exclude", started_ns)
+            source_file.digest = (source_file.previous[6] if source_file.previous is not None
+                                  else digests.cached_digest(entry.path, source_file.size, source_file.mtime_ns))
+            started_ns = profile.add("hash", started_ns)
+            if source_file.digest is not None and planned_bodies.setdefault(source_file.digest, source_file.rel_path) != source_file.rel_path:
+                # A known duplicate is not read ahead; the writer only reads it if the first copy could not be written
+                source_file.stream = True
+                return None, started_ns
+
+        if source_file.previous is not None:
+            return None, started_ns
+        if source_file.size is not None and source_file.size > STREAM_THRESHOLD_BYTES:
+            source_file.stream = True
+            return None, started_ns
+        return source_file.path, started_ns
+
+    def plan_source_files():
+        """Yields (SourceFile, path to read ahead or None, size hint) in walk order."""
+        for relative_path_normalized, entry in walk_root(root_dir, excluded_dirs_set, job, ignore_files=ignore_files,
+                                                            output_filepath=output_filepath):
+            started_ns = time.perf_counter_ns()
+            source_file = SourceFile(relative_path_normalized, path=entry.path)
+            read_path, started_ns = plan_source_file(source_file, entry, started_ns)
+            profile.add("exclude", started_ns)
+            yield source_file, read_path, (source_file.size or 0) if read_path is not None else 0
+
+    try:
+        with (BundleReader(os.path.dirname(output_filepath), previous_outputs, compression) if previous_entries
+              else contextlib.nullcontext()) as previous_output:
+            for source_file, raw_content in read_ahead(plan_source_files(), profile.timed_reader(read_source_file), read_workers, max_inflight_bytes):
+                job.check_cancelled()
+                file_started_ns = started_ns = time.perf_counter_ns()
+                relative_path_normalized = source_file.rel_path
+                try:
+                    outfile.begin_segment(relative_path_normalized)
+
+                    # Files whose raw bytes match a body already written become a reference to it
+                    if (digests is not None and source_file.size and source_file.path_only_reason is None
+                            and not isinstance(raw_content, Exception)):
+                        if source_file.digest is None:
+                            try:
+                                source_file.digest = hash_file(source_file.path) if source_file.stream else hashlib.sha1(raw_content).hexdigest()
+                            except OSError:
+                                pass # the streamed copy below will fail and report it
+                            else:
+                                digests.record(source_file.path, source_file.size, source_file.mtime_ns, source_file.digest)
+                            started_ns = profile.add("hash", started_ns)
+                        first_rel_path = written_bodies.get(source_file.digest)
+                        if first_rel_path is not None:
+                            job.log(f"Duplicate of {first_rel_path}: {relative_path_normalized}", LOG_DETAIL)
+                            started_ns = time.perf_counter_ns()
+                            outfile.write(encode_output_text(f"======= {relative_path_normalized} =======\n"
+                                                             f"======= SAME CONTENT AS {first_rel_path} =======\n\n"))
+                            outfile.end_segment()
+                            profile.add("write", started_ns)
+                            duplicate_count += 1
+                            bytes_saved += source_file.size or 0
+                            job.add_progress(files=1)
+                            files_processed_count += 1
+                            continue
+
+                    # Sniff files the classifier has not seen yet, from the bytes already read where possible
+                    if (classifier is not None and classifier.detect_binary and source_file.content_class is None
+                            and source_file.path_only_reason is None and source_file.previous is None
+                            and not isinstance(raw_content, Exception)):
+                        try:
+                            head = read_head(source_file.path) if source_file.stream else raw_content[:SNIFF_BYTES]
+                        except OSError:
+                            pass # the streamed copy below will fail and report it
+                        else:
+                            source_file.content_class = classifier.sniff(source_file.path, head, source_file.size, source_file.mtime_ns)
+                            if source_file.content_class == CONTENT_BINARY:
+                                source_file.path_only_reason = "binary"
+                        profile.add("decode", started_ns)
+
+                    if source_file.path_only_reason is not None:
+                        job.log(f"Path-only ({source_file.path_only_reason}): {relative_path_normalized}", LOG_DETAIL)
+                        started_ns = time.perf_counter_ns()
+                        # For path-only entries, only the header is written, followed by a blank line.
+                        outfile.write(encode_output_text(f"======= {relative_path_normalized} =======\n\n"))
+                        outfile.end_segment()
+                        profile.add("write", started_ns)
+                        path_only_count += 1
+                        job.add_progress(files=1)
+                        files_processed_count += 1
+                        continue
+                    if source_file.previous is not None:
+                        job.log(f"Unchanged (reused): {relative_path_normalized}", LOG_DETAIL)
+                        started_ns = time.perf_counter_ns()
+                        previous_output.copy_segment(source_file.previous[:4], outfile)
+                        manifest_entries[relative_path_normalized] = outfile.end_segment() + source_file.previous[4:]
+                        profile.add("write", started_ns)
+                        if source_file.digest is not None:
+                            written_bodies.setdefault(source_file.digest, relative_path_normalized)
+                        reused_count += 1
+                        job.add_progress(files=1, nbytes=source_file.previous[3])
+                        files_processed_count += 1
+                        continue
+
+                    started_ns = time.perf_counter_ns()
+                    # Common header for all processed files/paths
+                    outfile.write(encode_output_text(f"======= {relative_path_normalized} =======\n"))
+                    profile.add("write", started_ns)
+                    hasher = hashlib.sha1() if incremental and source_file.digest is None else None
+                    try:
+                        if isinstance(raw_content, Exception):
+                            raise raw_content
+                        if source_file.stream:
+                            job.log(f"Processing (content, streamed): {relative_path_normalized}", LOG_DETAIL)
+                            started_ns = time.perf_counter_ns()
+                            bytes_read, ends_with_newline = stream_normalized_copy(source_file.path, outfile, hasher) # charged to "write" as a whole
+                        else:
+                            job.log(f"Processing (content): {relative_path_normalized}", LOG_DETAIL)
+                            started_ns = time.perf_counter_ns()
+                            bytes_read = len(raw_content)
+                            if hasher is not None:
+                                hasher.update(raw_content)
+                                started_ns = profile.add("hash", started_ns)
+                            file_content = normalize_newlines(raw_content)
+                            output_content = to_output_newlines(file_content)
+                            started_ns = profile.add("decode", started_ns)
+                            outfile.write(output_content)
+                            ends_with_newline = not file_content or file_content.endswith(b'\n')
+                        # Ensure a newline before the "END OF" marker if content doesn't end with one
+                        if not ends_with_newline:
+                            outfile.write(OUTPUT_NEWLINE)
+                        outfile.write(encode_output_text(f"======= END OF {relative_path_normalized} =======\n\n"))
+                        locator = outfile.end_segment()
+                        profile.add("write", started_ns)
+                        if source_file.digest is not None:
+                            written_bodies.setdefault(source_file.digest, relative_path_normalized)
+                        if incremental and source_file.size is not None:
+                            file_mtime_ns = source_file.mtime_ns
+                            if compile_started_ns - file_mtime_ns < RACY_MTIME_WINDOW_NS:
+                                file_mtime_ns = -1 # never matches, so the file is re-read next run
+                            manifest_entries[relative_path_normalized] = locator + [source_file.size, file_mtime_ns,
+                                                                                    source_file.digest or hasher.hexdigest()]
+                        job.add_progress(files=1, nbytes=bytes_read)
+                    except Exception as e_read:
+                        # Write error to output file, including the path for clarity
+                        error_message = f"ERROR READING FILE ({relative_path_normalized}): {e_read}\n"
+                        outfile.write(encode_output_text(error_message + f"======= END OF {relative_path_normalized} (ERROR) =======\n\n"))
+                        outfile.end_segment()
+                        job.log(f"Error reading {relative_path_normalized}: {e_read}", LOG_ERROR)
+                        job.add_progress(files=1)
+                    files_processed_count += 1
+                finally:
+                    profile.file_done(relative_path_normalized, source_file.size, file_started_ns,
+                                      source_file.path if raw_content is not None else None)
+        outfile.commit()
+    except BaseException:
+        outfile.abort()
+        raise
+    finally:
+        if classifier is not None:
+            classifier.close()
+        if digests is not None:
+            digests.close()
+
+    log_bundle_summary(outfile, job)
+    if incremental:
+        save_compile_manifest(output_filepath, settings, manifest_entries, outfile.shard_paths)
+        job.log(f"Incremental compile: {reused_count} unchanged file(s) reused, {len(manifest_entries) - reused_count} re-read.")
+    if classifier is not None:
+        job.log(f"Content rules: {path_only_count} file(s) written path-only; {classifier.sniffed} sniffed, {classifier.cache.hits} classification(s) reused from cache.")
+        if classifier.cache.error is not None:
+            job.log(f"Classification cache unavailable, continued without it: {classifier.cache.error}", LOG_ERROR)
+    if digests is not None:
+        job.log(f"Dedup: {duplicate_count} duplicate file(s) written as references, {bytes_saved / (1024 * 1024):.1f} MB ({bytes_saved} bytes) saved; "
+                f"{digests.hashed} hashed, {digests.cache.hits} digest(s) reused from cache.")
+        if digests.cache.error is not None:
+            job.log(f"Digest cache unavailable, continued without it: {digests.cache.error}", LOG_ERROR)
+    save_run_profile(job, "compile", output_filepath)
+    return files_processed_count
+
+def export_paths(root_dir, output_filepath, excluded_dirs_set, job, index_path=None, ignore_files=False):
+    """Writes the relative path of every non-excluded file under root_dir. Returns the path count."""
+    paths_exported_count = 0
+    with open_file_index(index_path, root_dir) as file_index, open(output_filepath, 'w', encoding='utf-8') as outfile:
+        for relative_path_normalized, _ in walk_root(root_dir, excluded_dirs_set, job, file_index, ignore_files, output_filepath):
+            started_ns = time.perf_counter_ns()
+            outfile.write(relative_path_normalized + "\n")
+            job.profile.add("write", started_ns)
+            paths_exported_count += 1
+            job.add_progress(files=1)
+            if paths_exported_count % 200 == 0:
+                 job.log(f"Exported {paths_exported_count} paths...", LOG_DETAIL)
+        log_index_summary(file_index, job)
+    save_run_profile(job, "export-paths", output_filepath)
+    return paths_exported_count
+
+def export_selected_files(root_dir, output_filepath, selection, job, read_workers=1,
+                          max_inflight_bytes=READ_AHEAD_MAX_BYTES, compression="none", shard_bytes=0, index_path=None):
+    """Concatenates the files chosen by `selection` into output_filepath. Returns (files_processed, errors_encountered).
+
+    `selection` comes from parse_selection_list() (see resolve_selection() for
+    how it is matched; index_path enables the file index for pattern walks).
+    `compression` and `shard_bytes` work as in compile_sources().
+    """
+    files_processed_count = 0
+    errors_encountered = 0
+    with open_file_index(index_path, root_dir) as file_index:
+        resolved = resolve_selection(root_dir, selection, job, file_index, output_filepath)
+        log_index_summary(file_index, job)
+
+    def plan_reads():
+        """Yields ((rel_path, path), path to read ahead or None, size hint) in selection order; sizes are found by the read."""
+        for rel_path, full_path in resolved:
+            yield (rel_path, full_path), full_path, None
+
+    profile = job.profile
+    outfile = BundleWriter(output_filepath, compression, shard_bytes)
+    try:
+        for (normalized_rel_path_for_output, full_path), raw_content in read_ahead(plan_reads(), profile.timed_reader(read_unless_large),
+                                                                                   read_workers, max_inflight_bytes):
+            job.check_cancelled()
+            file_started_ns = time.perf_counter_ns()
+            outfile.begin_segment(normalized_rel_path_for_output)
+            if full_path is None:
+                job.log(f"SKIPPING (Not a file or not found): {normalized_rel_path_for_output}", LOG_ERROR)
+                outfile.write(encode_output_text(f"--- SKIPPED (Not a file or not found): {normalized_rel_path_for_output} ---\n\n"))
+                outfile.end_segment()
+                errors_encountered +=1
+                continue
+
+            job.log(f"Processing: {normalized_rel_path_for_output}", LOG_DETAIL)
+            started_ns = time.perf_counter_ns()
+            outfile.write(encode_output_text(f"--- RELATIVE PATH: {normalized_rel_path_for_output} ---\n"))
+            bytes_read = None
+            try:
+                if isinstance(raw_content, Exception):
+                    raise raw_content
+                if raw_content is None: # too large to read whole
+                    bytes_read, _ = stream_normalized_copy(full_path, outfile) # charged to "write" as a whole
+                else:
+                    bytes_read = len(raw_content)
+                    started_ns = profile.add("write", started_ns)
+                    output_content = to_output_newlines(normalize_newlines(raw_content))
+                    started_ns = profile.add("decode", started_ns)
+                    outfile.write(output_content)
+                outfile.write(OUTPUT_NEWLINE + OUTPUT_NEWLINE)
+                profile.add("write", started_ns)
+                files_processed_count += 1
+                job.add_progress(files=1, nbytes=bytes_read)
+            except Exception as e_read:
+                outfile.write(encode_output_text(f"ERROR READING FILE ({normalized_rel_path_for_output}): {e_read}\n\n"))
+                job.log(f"Error reading {normalized_rel_path_for_output}: {e_read}", LOG_ERROR)
+                errors_encountered +=1
+            outfile.end_segment()
+            profile.file_done(normalized_rel_path_for_output, bytes_read, file_started_ns, full_path)
+        outfile.commit()
+    except BaseException:
+        outfile.abort()
+        raise
+    log_bundle_summary(outfile, job)
+    save_run_profile(job, "export-selected", output_filepath)
+    return files_processed_count, errors_encountered
+
+def format_job_progress(job):
+    elapsed, files_per_sec, bytes_per_sec = job.rates()
+    return (f"{job.files_done} files, {job.bytes_done / (1024 * 1024):.1f} MB in {elapsed:.1f}s"
+            f" ({files_per_sec:.0f} files/s, {bytes_per_sec / (1024 * 1024):.2f} MB/s)")
+
+def format_extension_report(found_extensions_data, files_scanned):
+    """Formats scan_extensions() results the way the Source Compiler status pane shows them."""
+    if found_extensions_data:
+        report = "Found extensions (up to 3 examples each, from non-excluded directories):\n"
+        for ext_key in sorted(found_extensions_data.keys()):
+            report += f"\n{ext_key}:\n"
+            for example_path in found_extensions_data[ext_key]:
+                report += f"  - {example_path}\n"
+    else:
+        report = "No files with extensions found in non-excluded directories.\n"
+    return report + f"Total files scanned (in non-excluded dirs): {files_scanned}"